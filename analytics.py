@@ -0,0 +1,136 @@
+"""
+Information-gain analytics for guesses.
+
+For each guess we record how many codes could still have been the answer
+before and after it, plus the entropy (in bits) of how that guess splits the
+remaining candidates up by feedback. A guess with higher entropy is expected
+to narrow things down more.
+
+Candidates are narrowed incrementally, one guess at a time: boards small
+enough to have a feedback partition table (see partitions.py) narrow them down
+with it, and the rest score every candidate against the guess. Either way, the
+candidates left after each guess are kept for the next (see
+mastermind.guess_candidates), so a game's history is only replayed when
+they've been lost. They're kept in the smallest dtype that holds the board's
+codes, which is uint16 for most boards.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from codes import all_codes, pack_code, score_codes
+from partitions import get_partition_table
+
+# Tracking candidates for the biggest boards would take tens of megabytes per
+# game, so analytics are only recorded for boards with at most this many codes
+MAX_TRACKED_CODES = 8 ** 6
+
+# Boards with at most this many codes keep their candidates as uint16
+MAX_UINT16_CODES = 1 << 16
+
+GuessAnalysis = namedtuple(
+    "GuessAnalysis",
+    ["candidates_before", "candidates_after", "feedback_entropy", "candidates"],
+)
+
+
+def is_tracked(num_count=4, lower_bound=0, upper_bound=7):
+    """Returns whether analytics are recorded for a board of this size."""
+
+    return (upper_bound - lower_bound + 1) ** num_count <= MAX_TRACKED_CODES
+
+
+def candidate_dtype(num_count=4, lower_bound=0, upper_bound=7):
+    """
+    Returns the smallest NumPy dtype that holds every packed code on a board
+    of this size: uint16 if it has at most MAX_UINT16_CODES codes, otherwise
+    uint32.
+    """
+
+    if (upper_bound - lower_bound + 1) ** num_count <= MAX_UINT16_CODES:
+        return np.uint16
+
+    return np.uint32
+
+
+def analyze_guess(
+    candidates,
+    packed_guess,
+    correct_nums,
+    correct_locations,
+    num_count=4,
+    lower_bound=0,
+    upper_bound=7,
+):
+    """
+    Takes in the array of packed candidate codes that remained before a guess,
+    the packed guess itself and the feedback it got.
+
+    Returns a GuessAnalysis with the candidate counts before and after the
+    guess, the entropy of the guess's feedback partition, and the array of
+    candidates that remain after it (with the dtype from candidate_dtype).
+    """
+
+    table = get_partition_table(num_count, lower_bound, upper_bound)
+
+    if table is not None:
+        partition_sizes, remaining = table.partition(
+            candidates,
+            packed_guess,
+            correct_nums,
+            correct_locations,
+        )
+    else:
+        nums, locations = score_codes(
+            candidates,
+            packed_guess,
+            num_count,
+            lower_bound,
+            upper_bound,
+        )
+
+        # Give every possible (correct_nums, correct_locations) pair its own key
+        feedback_keys = nums * (num_count + 1) + locations
+        remaining = candidates[
+            feedback_keys == correct_nums * (num_count + 1) + correct_locations
+        ]
+        partition_sizes = np.bincount(feedback_keys)
+
+    probabilities = partition_sizes[partition_sizes > 0] / len(candidates)
+    entropy = float((probabilities * np.log2(1 / probabilities)).sum())
+
+    return GuessAnalysis(
+        len(candidates),
+        len(remaining),
+        entropy,
+        remaining.astype(
+            candidate_dtype(num_count, lower_bound, upper_bound),
+            copy=False,
+        ),
+    )
+
+
+def replay_candidates(history, num_count=4, lower_bound=0, upper_bound=7):
+    """
+    Takes in a list of guess records (anything with numbers_guessed,
+    correct_num_count and correct_location_count) and returns the array of
+    packed codes that are still consistent with all of them.
+
+    Only needed when a game's candidates aren't already in memory.
+    """
+
+    candidates = all_codes(num_count, lower_bound, upper_bound)
+
+    for guess in history:
+        candidates = analyze_guess(
+            candidates,
+            pack_code(guess.numbers_guessed, lower_bound, upper_bound),
+            guess.correct_num_count,
+            guess.correct_location_count,
+            num_count,
+            lower_bound,
+            upper_bound,
+        ).candidates
+
+    return candidates
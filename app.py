@@ -1,12 +1,37 @@
+import asyncio
+import atexit
 import os
+import secrets
+import time
+from functools import lru_cache
+from hashlib import blake2b
 
 from dotenv import load_dotenv
-from flask import Flask, request, render_template, session, redirect, flash, g
+from flask import (
+    Flask, request, render_template, session, redirect, flash, g,
+    make_response, jsonify, abort
+)
+from markupsafe import Markup
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 
 from db import db, connect_db
-from mastermind import MastermindGame
+from codes import InvalidCodeError, parse_code, parse_code_fields
+from mastermind import (
+    MastermindGame, GUESS_HISTORY_PAGE_SIZE, SCORE_CACHE_SIZE, score_cache,
+)
+from stats import GameResultCount
+from daily import DailyChallengeResultCount, daily_results, today
+from fetcher import random_fetcher
+from lru import LRUCache, MISSING
+from metrics import metrics
 from forms import CSRFForm
+from archive import archive_cli
+from rooms import race_rooms
+from solver import solver_cli
+from partitions import partitions_cli
+from seeded import SeededRandomNums
+from tasks import background_tasks
 
 # Flask loads our environmental variables for us when we start the app, but
 # it's a good idea to load them explicitly in case we run this file without
@@ -15,6 +40,41 @@ load_dotenv()
 
 DATABASE_URL = os.environ["DATABASE_URL"]
 CURR_GAME_KEY = "curr_game"
+RACE_PLAYER_KEY = "race_player"
+
+# A guess can be submitted with all of its numbers in this field, like "0123",
+# rather than one per num-0, num-1, ... field
+GUESS_FIELD = "guess"
+
+# Rendered guess history rows never change once a guess is made, so we keep
+# the most recently used ones around, keyed by (game_id, guess index)
+RENDERED_ROW_CACHE_SIZE = 10_000
+rendered_rows = LRUCache(maxsize=RENDERED_ROW_CACHE_SIZE)
+
+# Each rendered guess form carries a one-off idempotency key. We remember the
+# keys of recently made guesses, keyed by (game_id, key), so a double-click or
+# retried submission doesn't count as a second guess.
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_KEY_FIELD = "idempotency-key"
+RECENT_IDEMPOTENCY_KEYS_SIZE = 10_000
+recent_idempotency_keys = LRUCache(maxsize=RECENT_IDEMPOTENCY_KEYS_SIZE)
+
+# Each rendered guess form also carries the version of the game it was made
+# against. The keys above are only remembered by one worker process, so this
+# is what stops a retry that reaches another worker from counting twice.
+# It's optional: without it, a guess is made against whatever the latest
+# version is (concurrent guesses are still caught when they're committed).
+GAME_VERSION_FIELD = "version"
+
+# How long starting a new game waits on the random numbers API before giving
+# up, including any time spent queued behind other games' fetches
+NEW_GAME_FETCH_TIMEOUT_SECONDS = 15
+
+# How the fragment route answers when a submitted guess isn't made, through
+# no fault of the input: it repeats a guess that was already made, or
+# another guess was made first. Either way, there's no new row to add.
+DUPLICATE_GUESS_STATUS = 204
+CONFLICTING_GUESS_STATUS = 409
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL
@@ -22,7 +82,37 @@ app.config["SECRET_KEY"] = os.environ["SECRET_KEY"]
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SQLALCHEMY_ECHO'] = False
 
+# Set RANDOM_NUMS_SEED to generate answers from a seed instead of the random
+# numbers API, so load tests and benchmarks are reproducible. Not for
+# production: anyone who knows the seed knows every answer.
+app.config["RANDOM_NUMS_SEED"] = os.environ.get("RANDOM_NUMS_SEED")
+
+# How many scores each worker process keeps cached
+app.config["SCORE_CACHE_SIZE"] = int(
+    os.environ.get("SCORE_CACHE_SIZE", SCORE_CACHE_SIZE)
+)
+
 connect_db(app)
+app.cli.add_command(archive_cli)
+app.cli.add_command(solver_cli)
+app.cli.add_command(partitions_cli)
+
+background_tasks.init_app(app)
+daily_results.start(background_tasks)
+
+# Don't lose any daily challenge results still waiting to be written, or any
+# background tasks still waiting to run (these go first). Once they're done,
+# close the random numbers client.
+atexit.register(random_fetcher.close)
+atexit.register(daily_results.flush)
+atexit.register(background_tasks.join)
+
+score_cache.maxsize = app.config["SCORE_CACHE_SIZE"]
+
+if app.config["RANDOM_NUMS_SEED"] is not None:
+    MastermindGame.random_nums_source = SeededRandomNums(
+        int(app.config["RANDOM_NUMS_SEED"])
+    )
 
 
 @app.before_request
@@ -30,11 +120,20 @@ def add_curr_game_to_g():
     """
     Before every request, look to see if the browser sent a cookie with the
     current game_id. If so, query to fetch the game instance and put it onto g.
+
+    If the game no longer exists (it may have been archived and deleted since),
+    forget it and carry on without a current game.
     """
 
     if CURR_GAME_KEY in session:
         game_id = session[CURR_GAME_KEY]
-        g.curr_game = MastermindGame.query.get_or_404(game_id)
+        game = db.session.get(MastermindGame, game_id)
+
+        if game is None:
+            session.pop(CURR_GAME_KEY)
+            g.pop(CURR_GAME_KEY, None)
+        else:
+            g.curr_game = game
 
 
 @app.before_request
@@ -44,6 +143,47 @@ def add_csrf_form_to_g():
     g.csrf_form = CSRFForm()
 
 
+@app.template_global()
+def guess_history_row(index):
+    """
+    Returns the rendered HTML for the guess at the given (zero-based) index of
+    the current game's history, rendering it only if it isn't already cached.
+    """
+
+    key = (g.curr_game.id, index)
+    row = rendered_rows.get(key)
+
+    if row is MISSING:
+        row = Markup(render_template(
+            "_guess_history_row.html",
+            number=index + 1,
+            guess=g.curr_game.get_history_record(index),
+            feedback=g.curr_game.get_feedback_text(index),
+        ))
+        rendered_rows.put(key, row)
+
+    return row
+
+
+@app.template_global()
+def latest_guess_indexes():
+    """
+    Returns the range of (zero-based) indexes of the current game's latest
+    guesses, which are what its guess history shows by default.
+    """
+
+    guess_count = g.curr_game.guess_count
+
+    return range(max(0, guess_count - GUESS_HISTORY_PAGE_SIZE), guess_count)
+
+
+@app.template_global()
+def new_idempotency_key():
+    """Returns a new, random idempotency key for a guess form."""
+
+    return secrets.token_urlsafe(16)
+
+
 @app.get("/")
 def homepage():
     """
@@ -54,18 +194,38 @@ def homepage():
 
 
 @app.post("/new-game")
-def start_new_game():
+async def start_new_game():
     """
     On POST, start a new instance of MastermindGame and redirect to gameplay template.
 
+    The answer is fetched through the shared random_fetcher, so games started
+    at the same time share a call to the random numbers API. If that takes
+    longer than NEW_GAME_FETCH_TIMEOUT_SECONDS, redirect home to try again.
+
     If CSRF check fails, redirect home.
     """
 
     if g.csrf_form.validate_on_submit():
 
         num_count = int(request.form["num-count"])
+
+        # Seeded answers are made locally, without going to the API
+        random_nums = None
+        if MastermindGame.random_nums_source is None:
+            try:
+                random_nums = await asyncio.wait_for(
+                    random_fetcher.fetch_async(num_count),
+                    NEW_GAME_FETCH_TIMEOUT_SECONDS,
+                )
+            except asyncio.TimeoutError:
+                flash("We couldn't start a new game just now. Please try again.")
+                return redirect("/")
+
         try:
-            new_game = MastermindGame.generate_new_game(num_count=num_count)
+            new_game = MastermindGame.generate_new_game(
+                num_count=num_count,
+                random_nums=random_nums,
+            )
             db.session.commit()
             session[CURR_GAME_KEY] = new_game.id
             flash("New game started!")
@@ -80,6 +240,32 @@ def start_new_game():
         return redirect("/")
 
 
+@app.post("/new-daily-game")
+def start_daily_game():
+    """
+    On POST, start a new instance of MastermindGame for today's daily challenge
+    and redirect to gameplay template.
+
+    If CSRF check fails, redirect home.
+    """
+
+    if g.csrf_form.validate_on_submit():
+
+        num_count = int(request.form["num-count"])
+        try:
+            new_game = MastermindGame.generate_daily_game(num_count=num_count)
+            db.session.commit()
+            session[CURR_GAME_KEY] = new_game.id
+            flash("Daily challenge started!")
+        except IntegrityError:
+            db.session.rollback()
+
+        return redirect("/play")
+    else:
+        flash("You didn't come from the right place and we're onto you!")
+        return redirect("/")
+
+
 @app.get("/play")
 def play_game():
     """
@@ -101,7 +287,7 @@ def play_game():
     if g.curr_game.game_over:
         return redirect("/loss")
 
-    return render_template("gameplay.html")
+    return _render_game_page("gameplay.html")
 
 
 @app.post("/submit-guess")
@@ -111,7 +297,59 @@ def submit_guess():
     If the game is over, redirect to appropriate win/loss route.
     If the game is still going, redirect to the gameplay route.
 
-    If no current game exists or if CSRF check fails, redirects home.
+    If the guess conflicted with another guess, flashes a message asking the
+    player to try again. If no current game exists or if CSRF check fails,
+    redirects home.
+    """
+
+    response = _handle_submitted_guess()
+
+    if response == CONFLICTING_GUESS_STATUS:
+        flash("Your game changed before your guess went through. Please try again.")
+
+    if response is None or isinstance(response, int):
+        return redirect("/play")
+
+    return response
+
+
+@app.post("/submit-guess/fragment")
+def submit_guess_fragment():
+    """
+    On POST, works just like /submit-guess, except that if the game is still
+    going, responds with only the updated remaining guesses header and the
+    new guess history row rather than redirecting to the whole gameplay page.
+
+    If the guess wasn't made because it was a duplicate or conflicted with
+    another guess, responds with an empty DUPLICATE_GUESS_STATUS or
+    CONFLICTING_GUESS_STATUS instead.
+    """
+
+    response = _handle_submitted_guess()
+
+    if response is None:
+        return render_template("_guess_fragment.html")
+
+    if isinstance(response, int):
+        return "", response
+
+    return response
+
+
+def _handle_submitted_guess():
+    """
+    Shared by the guess submission routes. Extracts the guess from form data
+    and scores it for the current game.
+
+    Returns a redirect if the guess couldn't be made or ended the game, as
+    outlined in the routes above. Returns None if the guess was made and the
+    game is still going.
+
+    Resubmissions with the idempotency key of a recently made guess are
+    ignored, returning DUPLICATE_GUESS_STATUS, as are guesses rejected because
+    another request made a guess first (or because they were made against
+    another version of the game), returning CONFLICTING_GUESS_STATUS. Guesses
+    for a game that's already over are ignored too.
     """
 
     if CURR_GAME_KEY not in g:
@@ -121,35 +359,121 @@ def submit_guess():
         flash("You didn't come from the right place and we're onto you!")
         return redirect("/")
 
-    guessed_nums = []
+    # A retry of a guess that has already ended the game shouldn't count
+    if g.curr_game.game_over:
+        return _redirect_finished_game()
 
-    # There could be either 4, 6, or 8 inputs to collect, so better to do it
-    # dynamically
-    for i in range(g.curr_game.num_count):
-        try:
-            num = int(request.form[f"num-{i}"])
-            g.curr_game.validate_num(num)
-            guessed_nums.append(num)
-        except ValueError:
-            flash(
-                f"Integers must be between {g.curr_game.lower_bound} and {g.curr_game.upper_bound}."
-            )
-            return redirect("/play")
+    idempotency_key = (
+        request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        or request.form.get(IDEMPOTENCY_KEY_FIELD)
+    )
+    recent_key = (g.curr_game.id, idempotency_key)
+
+    if idempotency_key and recent_key in recent_idempotency_keys:
+        metrics.increment("duplicate_guesses")
+        return DUPLICATE_GUESS_STATUS
+
+    # Checking the version catches retries that recent_idempotency_keys
+    # doesn't know about, like ones made to another worker process
+    version = request.form.get(GAME_VERSION_FIELD)
+
+    if version is not None and version != str(g.curr_game.version):
+        metrics.increment("guess_conflicts")
+        return CONFLICTING_GUESS_STATUS
+
+    parsed_guess = _parse_guessed_nums(
+        g.curr_game.num_count,
+        g.curr_game.lower_bound,
+        g.curr_game.upper_bound,
+    )
+
+    if parsed_guess is None:
+        return redirect("/play")
 
     try:
         # The below method call will add a new Guess instance to the db session
-        g.curr_game.handle_guess(guessed_nums)
+        g.curr_game.handle_guess(*parsed_guess)
         db.session.commit()
-    except IntegrityError:
+    except (IntegrityError, StaleDataError) as exc:
         db.session.rollback()
 
-    if g.curr_game.has_won:
-        return redirect("/win")
+        # Another request made a guess from the same version of the game
+        # before we could, so this one is rejected as stale
+        if isinstance(exc, StaleDataError):
+            metrics.increment("guess_conflicts")
+
+        if g.curr_game.game_over:
+            return _redirect_finished_game()
+
+        return CONFLICTING_GUESS_STATUS
+    else:
+        if idempotency_key:
+            recent_idempotency_keys.put(recent_key, True)
+
+        # Only tally daily challenge results once they've been committed
+        if g.curr_game.game_over and g.curr_game.daily_challenge_date:
+            daily_results.record(
+                g.curr_game.daily_challenge_date,
+                g.curr_game.num_count,
+                g.curr_game.has_won,
+                g.curr_game.version,
+            )
+            background_tasks.submit(daily_results.flush_if_due)
 
     if g.curr_game.game_over:
-        return redirect("/loss")
+        return _redirect_finished_game()
+
+    return None
+
 
-    return redirect("/play")
+def _parse_guessed_nums(num_count, lower_bound, upper_bound):
+    """
+    Extracts num_count guessed numbers from the form, either written together
+    in its guess field (like "0123") or spread across its num-0, num-1, ...
+    fields, and checks they're within lower_bound and upper_bound.
+
+    Returns the numbers as a list of integers along with their packed code,
+    or flashes a message naming every invalid number and returns None.
+    """
+
+    try:
+        if GUESS_FIELD in request.form:
+            return parse_code(
+                request.form[GUESS_FIELD],
+                num_count,
+                lower_bound,
+                upper_bound,
+            )
+
+        return parse_code_fields(
+            request.form,
+            _num_field_names(num_count),
+            lower_bound,
+            upper_bound,
+        )
+    except InvalidCodeError as exc:
+        slots = ", ".join(str(slot + 1) for slot in exc.invalid_slots)
+        flash(
+            f"Integers must be between {lower_bound} and {upper_bound}. "
+            f"Check number(s) {slots}."
+        )
+        return None
+
+
+@lru_cache(maxsize=None)
+def _num_field_names(num_count):
+    """Returns the names of the form fields for num_count numbers, in order."""
+
+    return tuple(f"num-{i}" for i in range(num_count))
+
+
+def _redirect_finished_game():
+    """Redirects to the win or loss route, depending on how the game ended."""
+
+    if g.curr_game.has_won:
+        return redirect("/win")
+
+    return redirect("/loss")
 
 
 @app.get("/win")
@@ -173,7 +497,29 @@ def display_win():
     if not g.curr_game.has_won and g.curr_game.game_over:
         return redirect("/loss")
 
-    return render_template("win.html")
+    return _render_game_page("win.html")
+
+
+@app.get("/history")
+def display_history():
+    """
+    On GET, render a page of the current game's guess history, starting with
+    the latest guesses. Each page links to the one before it, by passing its
+    cursor as the "before" query parameter.
+
+    If no current game exists, redirects home. Responds with a 400 if the
+    cursor isn't valid.
+    """
+
+    if CURR_GAME_KEY not in g:
+        return redirect("/")
+
+    try:
+        page = g.curr_game.get_guess_page(before=request.args.get("before"))
+    except ValueError:
+        abort(400)
+
+    return render_template("history.html", page=page)
 
 
 @app.get("/loss")
@@ -197,7 +543,216 @@ def display_loss():
     if g.curr_game.has_won:
         return redirect("/win")
 
-    return render_template("loss.html")
+    return _render_game_page("loss.html")
+
+
+def _render_game_page(template_name):
+    """
+    Renders template_name, a page that depends only on the current game's
+    state, with an ETag so the browser can revalidate its copy later.
+
+    If the browser already has an up-to-date copy, responds with 304 Not
+    Modified without rendering the template at all.
+    """
+
+    etag = _curr_game_etag()
+
+    if etag is not None and etag in request.if_none_match:
+        response = make_response("", 304)
+    else:
+        response = make_response(render_template(template_name))
+
+    if etag is not None:
+        response.set_etag(etag)
+        # Always check back with us before reusing the cached page
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+
+    return response
+
+
+def _curr_game_etag():
+    """
+    Returns an ETag for the current game's state, built from its id, version
+    and win/loss status, like: "12-3-00-8f1c2a-472". The version changes with
+    every guess, so unlike the guess history, it's already loaded.
+
+    Pages also include a CSRF token, so the tag includes a hash of the
+    session's CSRF secret and a time bucket that rolls over well before the
+    token would expire. That way a revalidated page never holds a stale token.
+
+    Returns None if there are flashed messages waiting to be shown, as then
+    the page is about more than just the game's state.
+    """
+
+    if "_flashes" in session:
+        return None
+
+    game = g.curr_game
+    csrf_secret = session.get("csrf_token", "").encode()
+    csrf_time_limit = app.config.get("WTF_CSRF_TIME_LIMIT", 3600) or 3600
+
+    return "-".join([
+        str(game.id),
+        str(game.version),
+        f"{game.has_won:d}{game.game_over:d}",
+        blake2b(csrf_secret, digest_size=3).hexdigest(),
+        str(int(time.time() // (csrf_time_limit / 2))),
+    ])
+
+
+@app.get("/stats")
+def display_stats():
+    """
+    On GET, render a template with win rates, average guesses to win and the
+    distribution of guesses to win for each difficulty level.
+    """
+
+    return render_template("stats.html", stats=GameResultCount.summarize())
+
+
+@app.post("/rooms")
+def create_race_room():
+    """
+    On POST, create a new race room, where many players race to crack the
+    same combination, and redirect to it.
+
+    If CSRF check fails, redirect home.
+    """
+
+    if not g.csrf_form.validate_on_submit():
+        flash("You didn't come from the right place and we're onto you!")
+        return redirect("/")
+
+    num_count = int(request.form["num-count"])
+    room = race_rooms.create(
+        MastermindGame._fetch_random_nums(num_count),
+        num_count=num_count,
+    )
+
+    return redirect(f"/rooms/{room.id}")
+
+
+@app.get("/rooms/<int:room_id>")
+def display_race_room(room_id):
+    """
+    On GET, render a template with the race room's standings, plus the
+    current player's guesses and a form to join or make their next guess.
+    """
+
+    room = _get_race_room_or_404(room_id)
+    player_id = session.get(RACE_PLAYER_KEY)
+
+    return render_template(
+        "room.html",
+        room=room,
+        player=room.players.get(player_id),
+        has_submitted=player_id in room.pending,
+        feedback=room.feedback_for(player_id),
+        standings=room.standings(),
+    )
+
+
+@app.post("/rooms/<int:room_id>/join")
+def join_race_room(room_id):
+    """On POST, add the current player to the race room and redirect to it."""
+
+    room = _get_race_room_or_404(room_id)
+
+    if g.csrf_form.validate_on_submit():
+        if RACE_PLAYER_KEY not in session:
+            session[RACE_PLAYER_KEY] = secrets.token_urlsafe(16)
+
+        name = request.form.get("name", "").strip() or "Anonymous"
+        race_rooms.join(room, session[RACE_PLAYER_KEY], name[:40])
+
+    return redirect(f"/rooms/{room.id}")
+
+
+@app.post("/rooms/<int:room_id>/guess")
+def submit_race_guess(room_id):
+    """
+    On POST, queue the current player's guess for this round of the race room
+    and redirect to it. If every player still racing has now guessed, the
+    round is played straight away.
+    """
+
+    room = _get_race_room_or_404(room_id)
+
+    if not g.csrf_form.validate_on_submit():
+        flash("You didn't come from the right place and we're onto you!")
+        return redirect("/")
+
+    parsed_guess = _parse_guessed_nums(
+        room.num_count,
+        room.lower_bound,
+        room.upper_bound,
+    )
+
+    if parsed_guess is not None:
+        guessed_nums, _ = parsed_guess
+        try:
+            if room.submit_guess(session.get(RACE_PLAYER_KEY), guessed_nums):
+                race_rooms.play_round(room)
+        except ValueError:
+            flash("You're not racing in this room.")
+
+    return redirect(f"/rooms/{room.id}")
+
+
+@app.post("/rooms/<int:room_id>/end-round")
+def end_race_round(room_id):
+    """
+    On POST, play the race room's current round with whichever guesses have
+    been made so far, so players don't have to wait on anyone who's away.
+    """
+
+    room = _get_race_room_or_404(room_id)
+
+    if g.csrf_form.validate_on_submit():
+        race_rooms.play_round(room)
+
+    return redirect(f"/rooms/{room.id}")
+
+
+def _get_race_room_or_404(room_id):
+    """Returns the RaceRoom for room_id, or aborts with a 404."""
+
+    room = race_rooms.get(room_id)
+
+    if room is None:
+        abort(404)
+
+    return room
+
+
+@app.get("/daily")
+def display_daily_stats():
+    """
+    On GET, render a template with stats for today's daily challenge. These
+    are written periodically, so may be a little behind.
+    """
+
+    return render_template(
+        "daily.html",
+        date=today(),
+        stats=DailyChallengeResultCount.summarize(today()),
+    )
+
+
+@app.get("/metrics")
+def show_metrics():
+    """
+    On GET, respond with JSON of this worker process's metric counters, plus
+    the score cache's hit rate.
+    """
+
+    counts = metrics.snapshot()
+    hits = counts.get("score_cache_hits", 0)
+    lookups = hits + counts.get("score_cache_misses", 0)
+    counts["score_cache_hit_rate"] = hits / lookups if lookups else None
+
+    return jsonify(counts)
 
 
 @app.post("/restart")
@@ -0,0 +1,257 @@
+"""
+Archiving finished games, so the mastermind_games and guesses tables only
+need to hold games that are still being played (plus recent history).
+
+Archives are gzipped JSON Lines files with one finished game per line,
+including its guesses. Everything streams, so memory use stays flat no matter
+how many games there are.
+
+These are available as Flask CLI commands:
+
+    flask archive export games.jsonl.gz [--delete]
+    flask archive import games.jsonl.gz
+"""
+
+import gzip
+import json
+import time
+from datetime import date, datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import select
+
+from db import db
+from mastermind import MastermindGame, Guess
+
+# How many games are read, written or deleted at a time
+ARCHIVE_BATCH_SIZE = 500
+
+# How long to pause between batches of deletes, so archiving doesn't hold up
+# the games being played at the same time
+DELETE_PAUSE_SECONDS = 0.1
+
+GAME_FIELDS = [
+    "id",
+    "num_count",
+    "lower_bound",
+    "upper_bound",
+    "answer",
+    "has_won",
+    "game_over",
+    "daily_challenge_date",
+    "version",
+]
+
+GUESS_FIELDS = [
+    "numbers_guessed",
+    "correct_num_count",
+    "correct_location_count",
+    "candidates_before",
+    "candidates_after",
+    "feedback_entropy",
+]
+
+
+def export_games(path, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Streams every finished game and its guesses into a gzipped JSON Lines
+    file at path. Games are read through a server-side cursor, batch_size at a
+    time, and each batch's guesses are loaded with a single query.
+
+    Returns the number of games exported.
+    """
+
+    games_query = (
+        select(MastermindGame)
+        .where(MastermindGame.game_over)
+        .order_by(MastermindGame.id)
+        .execution_options(yield_per=batch_size)
+    )
+    exported = 0
+
+    with gzip.open(path, "wt", encoding="utf-8") as file:
+        for games in db.session.execute(games_query).scalars().partitions():
+            guesses_by_game = _load_guesses([game.id for game in games])
+
+            for game in games:
+                file.write(json.dumps(
+                    _serialize_game(game, guesses_by_game.get(game.id, []))
+                ))
+                file.write("\n")
+
+            exported += len(games)
+
+            # Don't let the session hold onto games we're done with
+            db.session.expunge_all()
+
+    db.session.commit()
+    return exported
+
+
+def delete_archived_games(
+    path,
+    batch_size=ARCHIVE_BATCH_SIZE,
+    pause_seconds=DELETE_PAUSE_SECONDS,
+):
+    """
+    Reads back an archive made by export_games and deletes the games in it
+    from the database, batch_size at a time. Their guesses are removed by the
+    database itself, via the foreign key's ON DELETE CASCADE.
+
+    Only ids found in the archive are deleted, so games that finished after it
+    was written are left alone. Each batch is committed separately, with a
+    pause in between to avoid holding locks for long.
+
+    Returns the number of games deleted.
+    """
+
+    deleted = 0
+
+    for batch in _read_batches(path, batch_size):
+        ids = [game["id"] for game in batch]
+        result = db.session.execute(
+            MastermindGame.__table__.delete()
+            .where(MastermindGame.id.in_(ids))
+            .where(MastermindGame.game_over)
+        )
+        db.session.commit()
+
+        deleted += result.rowcount
+        time.sleep(pause_seconds)
+
+    return deleted
+
+
+def import_games(path, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Streams games from an archive made by export_games back into the
+    database, committing batch_size games at a time, so they can be replayed.
+    Games get new ids, as their old ones may have been reused.
+
+    Returns the number of games imported.
+    """
+
+    imported = 0
+
+    for batch in _read_batches(path, batch_size):
+        for data in batch:
+            # Archives made before daily challenge dates were exported don't
+            # have one
+            daily_date = data.get("daily_challenge_date")
+            data["daily_challenge_date"] = (
+                date.fromisoformat(daily_date) if daily_date else None
+            )
+
+            game = MastermindGame(**{
+                field: data[field] for field in GAME_FIELDS if field != "id"
+            })
+            # Guesses are archived in order, so they're numbered by position
+            game.guess_history = [
+                Guess(
+                    seq=seq,
+                    occurred_at=datetime.fromisoformat(guess["occurred_at"]),
+                    **{field: guess[field] for field in GUESS_FIELDS},
+                )
+                for seq, guess in enumerate(data["guesses"], start=1)
+            ]
+            db.session.add(game)
+
+        db.session.commit()
+        db.session.expunge_all()
+        imported += len(batch)
+
+    return imported
+
+
+def _load_guesses(game_ids):
+    """
+    Returns a dictionary of game_id -> list of that game's guesses in order,
+    for the given game_ids, using a single query.
+    """
+
+    guesses_by_game = {}
+    guesses = (
+        Guess.query
+        .filter(Guess.game_id.in_(game_ids))
+        .order_by(Guess.game_id, Guess.occurred_at, Guess.id)
+    )
+
+    for guess in guesses:
+        guesses_by_game.setdefault(guess.game_id, []).append(guess)
+
+    return guesses_by_game
+
+
+def _serialize_game(game, guesses):
+    """Returns a JSON-friendly dictionary of a game and its guesses."""
+
+    data = {field: getattr(game, field) for field in GAME_FIELDS}
+    data["answer"] = list(game.answer)
+
+    if game.daily_challenge_date is not None:
+        data["daily_challenge_date"] = game.daily_challenge_date.isoformat()
+
+    data["guesses"] = [
+        {
+            **{field: getattr(guess, field) for field in GUESS_FIELDS},
+            "numbers_guessed": list(guess.numbers_guessed),
+            "occurred_at": guess.occurred_at.isoformat(),
+        }
+        for guess in guesses
+    ]
+
+    return data
+
+
+def _read_batches(path, batch_size):
+    """
+    Reads an archive made by export_games, yielding lists of up to batch_size
+    deserialized games at a time.
+    """
+
+    batch = []
+
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            batch.append(json.loads(line))
+
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+    if batch:
+        yield batch
+
+
+archive_cli = AppGroup("archive", help="Archive and restore finished games.")
+
+
+@archive_cli.command("export")
+@click.argument("path")
+@click.option(
+    "--delete",
+    is_flag=True,
+    help="Delete the archived games from the database afterwards.",
+)
+@click.option("--batch-size", default=ARCHIVE_BATCH_SIZE, show_default=True)
+@click.option("--pause", default=DELETE_PAUSE_SECONDS, show_default=True)
+def export_command(path, delete, batch_size, pause):
+    """Export finished games to a gzipped JSON Lines file at PATH."""
+
+    exported = export_games(path, batch_size)
+    click.echo(f"Exported {exported} game(s) to {path}.")
+
+    if delete:
+        deleted = delete_archived_games(path, batch_size, pause)
+        click.echo(f"Deleted {deleted} archived game(s).")
+
+
+@archive_cli.command("import")
+@click.argument("path")
+@click.option("--batch-size", default=ARCHIVE_BATCH_SIZE, show_default=True)
+def import_command(path, batch_size):
+    """Import games from an archive at PATH so they can be replayed."""
+
+    imported = import_games(path, batch_size)
+    click.echo(f"Imported {imported} game(s) from {path}.")
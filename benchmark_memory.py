@@ -0,0 +1,137 @@
+"""
+Benchmarks how much memory each active game takes up: a GameState held in
+the cache of active games, against a MastermindGame with its guess_history
+of Guess instances, at GAME_COUNT games played GUESSES_PER_GAME guesses in.
+
+The models are built in memory rather than loaded through a session, so
+their figure leaves out the identity map and is a lower bound. They're only
+measured for ORM_GAME_COUNT games, as that's plenty to work out a figure
+per game.
+
+Run it from the top-level directory with:
+
+    python benchmark_memory.py
+"""
+
+import gc
+import random
+import tracemalloc
+
+from codes import pack_code
+from game_cache import ActiveGameCache
+from game_state import GameState
+from mastermind import Guess, MastermindGame
+
+GAME_COUNT = 100_000
+ORM_GAME_COUNT = 10_000
+GUESSES_PER_GAME = 5
+NUM_COUNT = 4
+LOWER_BOUND = 0
+UPPER_BOUND = 7
+
+
+def random_code(rng):
+    """Returns a random list of NUM_COUNT numbers within the bounds."""
+
+    return [rng.randint(LOWER_BOUND, UPPER_BOUND) for _ in range(NUM_COUNT)]
+
+
+def build_game_states(rng, game_count):
+    """Returns a cache of game_count GameStates, with their guesses made."""
+
+    cache = ActiveGameCache()
+
+    for game_id in range(1, game_count + 1):
+        game_state = GameState(
+            game_id,
+            pack_code(random_code(rng), LOWER_BOUND, UPPER_BOUND),
+            NUM_COUNT,
+            LOWER_BOUND,
+            UPPER_BOUND,
+        )
+
+        for _ in range(GUESSES_PER_GAME):
+            game_state.make_guess(
+                pack_code(random_code(rng), LOWER_BOUND, UPPER_BOUND)
+            )
+
+        cache.add(game_id, game_state)
+
+    return cache
+
+
+def build_models(rng, game_count):
+    """Returns a list of game_count MastermindGames, with their guesses."""
+
+    games = []
+
+    for game_id in range(1, game_count + 1):
+        answer = random_code(rng)
+        game = MastermindGame(
+            id=game_id,
+            answer=answer,
+            num_count=NUM_COUNT,
+            lower_bound=LOWER_BOUND,
+            upper_bound=UPPER_BOUND,
+            has_won=False,
+            game_over=False,
+            version=GUESSES_PER_GAME,
+        )
+
+        for seq in range(1, GUESSES_PER_GAME + 1):
+            numbers_guessed = random_code(rng)
+            score = game.score_guess(numbers_guessed)
+            game.guess_history.append(
+                Guess(
+                    game_id=game_id,
+                    seq=seq,
+                    numbers_guessed=numbers_guessed,
+                    correct_num_count=score["correct_nums"],
+                    correct_location_count=score["correct_locations"],
+                )
+            )
+
+        games.append(game)
+
+    return games
+
+
+def bytes_per_game(build, game_count):
+    """
+    Builds game_count games with build, and returns how many bytes of memory
+    they take up, per game.
+    """
+
+    rng = random.Random(0)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    games = build(rng, game_count)
+
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del games
+
+    return (after - before) / game_count
+
+
+def main():
+    print(f"{'games':>8} {'bytes per game':>15} {'MB in all':>10}  representation")
+
+    for name, build, game_count in (
+        ("GameState", build_game_states, GAME_COUNT),
+        ("MastermindGame + Guesses", build_models, ORM_GAME_COUNT),
+    ):
+        per_game = bytes_per_game(build, game_count)
+        print(
+            f"{game_count:>8} {per_game:>15,.0f} "
+            f"{per_game * GAME_COUNT / 1e6:>10.1f}  {name}"
+        )
+
+    print(f"(MB in all is for {GAME_COUNT:,} games)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmarks parsing a submitted guess: the original loop over the num-0,
+num-1, ... form fields against parse_code_fields and parse_code, for boards
+of 8 or more numbers.
+
+Run it from the top-level directory with:
+
+    python benchmark_parsing.py
+"""
+
+import timeit
+
+from werkzeug.datastructures import ImmutableMultiDict
+
+from codes import pack_code, parse_code, parse_code_fields
+
+NUM_COUNTS = [8, 16, 32, 64]
+LOWER_BOUND = 0
+UPPER_BOUND = 7
+REPEATS = 5
+NUMBER = 20_000
+
+
+def loop_parse(form, num_count, lower_bound, upper_bound):
+    """The original parsing loop, then packing the numbers separately."""
+
+    guessed_nums = []
+
+    for i in range(num_count):
+        try:
+            num = int(form[f"num-{i}"])
+            if num > upper_bound or num < lower_bound:
+                raise ValueError()
+            guessed_nums.append(num)
+        except ValueError:
+            return None
+
+    return guessed_nums, pack_code(guessed_nums, lower_bound, upper_bound)
+
+
+def best_microseconds(func):
+    """Returns the best time of REPEATS runs of func, in microseconds per call."""
+
+    return min(timeit.repeat(func, repeat=REPEATS, number=NUMBER)) / NUMBER * 1e6
+
+
+def main():
+    print(f"{'numbers':>8} {'loop':>10} {'fields':>10} {'packed':>10}  (microseconds per guess)")
+
+    for num_count in NUM_COUNTS:
+        numbers = [i % (UPPER_BOUND + 1) for i in range(num_count)]
+        form = ImmutableMultiDict(
+            (f"num-{i}", str(num)) for i, num in enumerate(numbers)
+        )
+        field_names = tuple(f"num-{i}" for i in range(num_count))
+        text = "".join(str(num) for num in numbers)
+
+        expected = loop_parse(form, num_count, LOWER_BOUND, UPPER_BOUND)
+        assert parse_code_fields(form, field_names, LOWER_BOUND, UPPER_BOUND) == expected
+        assert parse_code(text, num_count, LOWER_BOUND, UPPER_BOUND) == expected
+
+        loop_time = best_microseconds(
+            lambda: loop_parse(form, num_count, LOWER_BOUND, UPPER_BOUND)
+        )
+        fields_time = best_microseconds(
+            lambda: parse_code_fields(form, field_names, LOWER_BOUND, UPPER_BOUND)
+        )
+        packed_time = best_microseconds(
+            lambda: parse_code(text, num_count, LOWER_BOUND, UPPER_BOUND)
+        )
+
+        print(
+            f"{num_count:>8} {loop_time:>10.2f} {fields_time:>10.2f} "
+            f"{packed_time:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Helpers for working with number combinations (answers and guesses) in a
+compact form.
+
+A combination like [1, 2, 3, 4] is "packed" into a single integer by treating
+each number as a digit in base (upper_bound - lower_bound + 1), with the first
+number as the most significant digit. Packed codes take up far less memory
+than lists of integers and sort in the same order as the combinations they
+represent.
+
+There are also vectorized helpers, built on NumPy, for scoring a guess against
+many packed codes at once with the same rules as MastermindGame.score_guess.
+"""
+
+import numpy as np
+
+
+def pack_code(numbers, lower_bound=0, upper_bound=7):
+    """
+    Takes in a list of numbers and packs them into a single integer, like:
+
+    Input: [1, 2, 3, 4] (with bounds of 0 and 7)
+
+    Output: 668 (1*8^3 + 2*8^2 + 3*8 + 4)
+    """
+
+    base = upper_bound - lower_bound + 1
+    code = 0
+
+    for num in numbers:
+        code = code * base + (num - lower_bound)
+
+    return code
+
+
+def unpack_code(code, num_count=4, lower_bound=0, upper_bound=7):
+    """
+    Takes in a packed code and unpacks it back into a list of num_count
+    numbers, like:
+
+    Input: 668 (with a num_count of 4 and bounds of 0 and 7)
+
+    Output: [1, 2, 3, 4]
+    """
+
+    base = upper_bound - lower_bound + 1
+    numbers = [0] * num_count
+
+    # Fill in from the least significant digit, which is the last number
+    for i in range(num_count - 1, -1, -1):
+        code, digit = divmod(code, base)
+        numbers[i] = digit + lower_bound
+
+    return numbers
+
+
+def score_code(answer_code, guess_code, num_count=4, lower_bound=0, upper_bound=7):
+    """
+    Scores a single packed guess_code against a single packed answer_code,
+    with the same rules as MastermindGame.score_guess, but without unpacking
+    either of them into a list.
+
+    Returns a tuple of the correct number count and the correct location
+    count, like: (2, 1)
+    """
+
+    base = upper_bound - lower_bound + 1
+    answer_counts = [0] * base
+    guess_counts = [0] * base
+    correct_locations = 0
+
+    for _ in range(num_count):
+        answer_code, answer_digit = divmod(answer_code, base)
+        guess_code, guess_digit = divmod(guess_code, base)
+
+        if answer_digit == guess_digit:
+            correct_locations += 1
+
+        answer_counts[answer_digit] += 1
+        guess_counts[guess_digit] += 1
+
+    # A number is only correct as many times as it appears in both
+    correct_nums = sum(map(min, answer_counts, guess_counts))
+
+    return correct_nums, correct_locations
+
+
+class InvalidCodeError(ValueError):
+    """
+    Raised when parsing a code with numbers that are missing, aren't integers
+    or are out of bounds. invalid_slots is a list of the (zero-based)
+    positions of every one of them.
+    """
+
+    def __init__(self, invalid_slots):
+        super().__init__(f"Invalid numbers at slots {invalid_slots}")
+        self.invalid_slots = invalid_slots
+
+
+def parse_code(text, num_count=4, lower_bound=0, upper_bound=7):
+    """
+    Parses a code written with one digit per number, like "1234", checking
+    and packing each number in a single pass. Only suits bounds between 0 and
+    9. Returns the numbers and their packed code, like:
+
+    Input: "1234" (with a num_count of 4 and bounds of 0 and 7)
+
+    Output: ([1, 2, 3, 4], 668)
+
+    Raises InvalidCodeError listing every bad slot, including any missing
+    from the end of text or beyond num_count.
+    """
+
+    base = upper_bound - lower_bound + 1
+    text_length = len(text)
+    numbers = [0] * num_count
+    code = 0
+    invalid_slots = []
+
+    for i in range(min(num_count, text_length)):
+        # With bounds between 0 and 9, this rules out anything but digits too
+        num = ord(text[i]) - 48
+
+        if lower_bound <= num <= upper_bound:
+            numbers[i] = num
+            code = code * base + (num - lower_bound)
+        else:
+            invalid_slots.append(i)
+
+    # Slots missing from the end of text, or beyond num_count
+    invalid_slots.extend(range(text_length, num_count))
+    invalid_slots.extend(range(num_count, text_length))
+
+    if invalid_slots:
+        raise InvalidCodeError(invalid_slots)
+
+    return numbers, code
+
+
+def parse_code_fields(fields, field_names, lower_bound=0, upper_bound=7):
+    """
+    Parses a code given as one field per number, looking each number up in
+    fields (any mapping, like a form) by field_names, in order. Checks and
+    packs each number in a single pass. Returns the numbers and their packed
+    code, like parse_code.
+
+    Raises InvalidCodeError listing every bad slot, including missing ones.
+    """
+
+    base = upper_bound - lower_bound + 1
+    numbers = [0] * len(field_names)
+    code = 0
+    invalid_slots = []
+
+    for i, name in enumerate(field_names):
+        try:
+            num = int(fields.get(name, ""))
+        except ValueError:
+            invalid_slots.append(i)
+            continue
+
+        if lower_bound <= num <= upper_bound:
+            numbers[i] = num
+            code = code * base + (num - lower_bound)
+        else:
+            invalid_slots.append(i)
+
+    if invalid_slots:
+        raise InvalidCodeError(invalid_slots)
+
+    return numbers, code
+
+
+def all_codes(num_count=4, lower_bound=0, upper_bound=7):
+    """
+    Returns a NumPy array of every possible packed code for a board with the
+    given num_count and bounds, in sorted order.
+    """
+
+    base = upper_bound - lower_bound + 1
+
+    return np.arange(base ** num_count, dtype=np.uint32)
+
+
+def code_digits(codes, num_count=4, lower_bound=0, upper_bound=7):
+    """
+    Takes in an array of packed codes and returns a 2D array with a row of
+    digits for each code. Digits are offset from lower_bound, so they always
+    run from 0 to (upper_bound - lower_bound), like:
+
+    Input: [668, 0] (with a num_count of 4 and bounds of 0 and 7)
+
+    Output: [[1, 2, 3, 4], [0, 0, 0, 0]]
+    """
+
+    base = upper_bound - lower_bound + 1
+    powers = base ** np.arange(num_count - 1, -1, -1, dtype=np.int64)
+    codes = np.asarray(codes, dtype=np.int64)
+
+    return ((codes[:, np.newaxis] // powers) % base).astype(np.uint8)
+
+
+def score_codes(answer_codes, guess_code, num_count=4, lower_bound=0, upper_bound=7):
+    """
+    Scores a single packed guess_code against every packed code in
+    answer_codes, as if each were the hidden answer. Follows the same rules as
+    MastermindGame.score_guess.
+
+    Returns a tuple of two arrays: the correct number counts and the correct
+    location counts for each answer.
+    """
+
+    base = upper_bound - lower_bound + 1
+    answers = code_digits(answer_codes, num_count, lower_bound, upper_bound)
+    guess = np.array(unpack_code(guess_code, num_count, 0, base - 1), dtype=np.uint8)
+
+    correct_locations = (answers == guess).sum(axis=1)
+
+    # A number is only correct as many times as it appears in both the guess
+    # and the answer, wherever it is
+    guess_counts = np.bincount(guess, minlength=base)
+    correct_nums = np.zeros(len(answers), dtype=np.int64)
+
+    for digit in np.flatnonzero(guess_counts):
+        correct_nums += np.minimum(
+            (answers == digit).sum(axis=1),
+            guess_counts[digit],
+        )
+
+    return correct_nums, correct_locations
+
+
+def score_code_matrix(guess_codes, answer_codes, num_count=4, lower_bound=0, upper_bound=7):
+    """
+    Scores every packed code in guess_codes against every packed code in
+    answer_codes at once, with the same rules as score_codes.
+
+    Returns a tuple of two 2D arrays, with a row for each guess and a column
+    for each answer: the correct number counts and the correct location
+    counts. Callers should keep the number of guesses times answers modest,
+    as the intermediate arrays are num_count times that size.
+    """
+
+    base = upper_bound - lower_bound + 1
+    guesses = code_digits(guess_codes, num_count, lower_bound, upper_bound)
+    answers = code_digits(answer_codes, num_count, lower_bound, upper_bound)
+
+    correct_locations = (
+        guesses[:, np.newaxis, :] == answers[np.newaxis, :, :]
+    ).sum(axis=2)
+
+    correct_nums = np.zeros((len(guesses), len(answers)), dtype=np.int64)
+
+    for digit in range(base):
+        correct_nums += np.minimum.outer(
+            (guesses == digit).sum(axis=1),
+            (answers == digit).sum(axis=1),
+        )
+
+    return correct_nums, correct_locations
@@ -0,0 +1,284 @@
+"""
+The daily challenge: every player gets the same hidden combination for a
+given (date, num_count).
+
+Each day's answer is fetched from the random numbers API once and stored, and
+every worker process keeps the answers it has seen in memory.
+
+Results are tallied in memory and written to the database periodically, as
+daily challenge traffic tends to come in bursts.
+"""
+
+import time
+from collections import Counter
+from datetime import datetime
+from threading import Event, Lock, Thread
+
+from sqlalchemy import ARRAY, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+
+from db import db
+from lru import LRUCache, MISSING
+from stats import summarize_results
+
+DAILY_ANSWER_CACHE_SIZE = 64
+DAILY_RESULTS_FLUSH_SECONDS = 60
+
+
+def today():
+    """Returns the current date of the daily challenge (in UTC)."""
+
+    return datetime.utcnow().date()
+
+
+class DailyChallenge(db.Model):
+    """The hidden combination shared by everyone for one day and num_count."""
+
+    __tablename__ = 'daily_challenges'
+
+    date = db.Column(
+        db.Date,
+        primary_key=True,
+    )
+
+    num_count = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    answer = db.Column(
+        ARRAY(db.Integer),
+        nullable=False,
+    )
+
+    def __repr__(self):
+        return f"<DailyChallenge {self.date}, num_count={self.num_count}>"
+
+    @classmethod
+    def get_answer(cls, date, num_count, fetch_random_nums):
+        """
+        Returns the answer for the daily challenge on date with num_count
+        numbers, as a list of integers.
+
+        If there isn't one yet, calls fetch_random_nums(num_count) to make it.
+        It's saved in a transaction of its own, so it's shared with every
+        other worker straight away. If another worker beat us to it, theirs
+        is used instead.
+        """
+
+        key = (date, num_count)
+        answer = daily_answers.get(key)
+
+        if answer is not MISSING:
+            return answer
+
+        with _daily_answers_lock:
+            # Another thread may have loaded it while we waited for the lock
+            answer = daily_answers.get(key)
+
+            if answer is MISSING:
+                answer = cls._load_or_create_answer(
+                    date,
+                    num_count,
+                    fetch_random_nums,
+                )
+                daily_answers.put(key, answer)
+
+        return answer
+
+    @classmethod
+    def _load_or_create_answer(cls, date, num_count, fetch_random_nums):
+        """
+        Loads the answer for date and num_count from the database, creating
+        it first if needed, in a separate transaction that's committed
+        straight away. Returns the answer as a list of integers.
+        """
+
+        answer_query = select(cls.answer).where(
+            cls.date == date,
+            cls.num_count == num_count,
+        )
+
+        with db.engine.begin() as connection:
+            answer = connection.execute(answer_query).scalar()
+
+            if answer is None:
+                connection.execute(
+                    insert(cls)
+                    .values(
+                        date=date,
+                        num_count=num_count,
+                        answer=fetch_random_nums(num_count),
+                    )
+                    .on_conflict_do_nothing()
+                )
+                answer = connection.execute(answer_query).scalar_one()
+
+        return answer
+
+
+class DailyChallengeResultCount(db.Model):
+    """
+    How many daily challenge games on a particular date, with a particular
+    num_count, ended with a particular result after a particular number of
+    guesses.
+    """
+
+    __tablename__ = 'daily_challenge_result_counts'
+
+    date = db.Column(
+        db.Date,
+        primary_key=True,
+    )
+
+    num_count = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    has_won = db.Column(
+        db.Boolean,
+        primary_key=True,
+    )
+
+    guess_count = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    games = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    def __repr__(self):
+        return (
+            f"<DailyChallengeResultCount {self.date}, num_count={self.num_count}, "
+            f"has_won={self.has_won}, guess_count={self.guess_count}: {self.games}>"
+        )
+
+    @classmethod
+    def summarize(cls, date):
+        """
+        Returns a list of stats for each num_count with finished daily
+        challenge games on date, in the same format as
+        GameResultCount.summarize.
+        """
+
+        return summarize_results(
+            cls.query
+            .filter_by(date=date)
+            .order_by(cls.num_count, cls.guess_count)
+        )
+
+
+class DailyResultsBuffer:
+    """
+    Tallies finished daily challenge games in memory, and adds the tallies
+    to DailyChallengeResultCount rows every flush_seconds or so, once start
+    has been called.
+    """
+
+    def __init__(self, flush_seconds=DAILY_RESULTS_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._counts = Counter()
+        self._lock = Lock()
+        self._last_flushed = time.monotonic()
+        self._timer = None
+        self._stopped = Event()
+
+    def start(self, task_queue):
+        """
+        Starts a daemon thread that queues a flush on task_queue (a
+        tasks.TaskQueue, which gives it an app context) every flush_seconds,
+        so the last tallies of a burst are written without waiting for more
+        games to finish. Does nothing if it's already running. Returns None.
+        """
+
+        with self._lock:
+            if self._timer is not None:
+                return
+
+            self._stopped.clear()
+            self._timer = Thread(
+                target=self._flush_periodically,
+                args=(task_queue,),
+                name="daily-results-flusher",
+                daemon=True,
+            )
+            self._timer.start()
+
+    def stop(self):
+        """Stops the thread started by start, if it's running. Returns None."""
+
+        with self._lock:
+            timer, self._timer = self._timer, None
+
+        if timer is not None:
+            self._stopped.set()
+            timer.join()
+
+    def _flush_periodically(self, task_queue):
+        """Queues a flush every flush_seconds until stopped."""
+
+        while not self._stopped.wait(self.flush_seconds):
+            task_queue.submit(self.flush)
+
+    def record(self, date, num_count, has_won, guess_count):
+        """Tallies one finished daily challenge game. Returns None."""
+
+        with self._lock:
+            self._counts[(date, num_count, has_won, guess_count)] += 1
+
+    def flush_if_due(self):
+        """Flushes the tallies if it's been long enough since the last time."""
+
+        if time.monotonic() - self._last_flushed >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        """
+        Adds every tally to the database in one transaction and clears them.
+        If that fails, the tallies are kept for next time and the error is
+        raised. Returns None.
+        """
+
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._last_flushed = time.monotonic()
+
+        if not counts:
+            return
+
+        statement = insert(DailyChallengeResultCount).values([
+            {
+                "date": date,
+                "num_count": num_count,
+                "has_won": has_won,
+                "guess_count": guess_count,
+                "games": games,
+            }
+            for (date, num_count, has_won, guess_count), games in counts.items()
+        ])
+        statement = statement.on_conflict_do_update(
+            index_elements=["date", "num_count", "has_won", "guess_count"],
+            set_={"games": DailyChallengeResultCount.games + statement.excluded.games},
+        )
+
+        try:
+            db.session.execute(statement)
+            db.session.commit()
+        except SQLAlchemyError:
+            db.session.rollback()
+            with self._lock:
+                self._counts.update(counts)
+            raise
+
+
+# Shared across requests within this process
+daily_answers = LRUCache(maxsize=DAILY_ANSWER_CACHE_SIZE)
+_daily_answers_lock = Lock()
+
+daily_results = DailyResultsBuffer()
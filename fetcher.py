@@ -0,0 +1,224 @@
+"""
+An asynchronous, coalescing client for the random numbers API.
+
+Fetches run on an asyncio event loop in a dedicated background thread, using
+one shared httpx.AsyncClient so connections to the API are reused. Requests
+that come in while a call to the API is already in flight are batched up and
+served together by the next call, so a burst of new games costs a handful of
+round trips rather than one each.
+
+Both sync and async callers can use it:
+
+    nums = random_fetcher.fetch(4).result()
+    nums = await random_fetcher.fetch_async(4)
+
+Flask only speaks WSGI, so an async view awaiting fetch_async still runs in a
+per-request event loop (through asgiref) on the request's own thread, which
+waits for the fetch. What's saved is the coalescing and connection reuse,
+not the thread.
+
+Call close() on shutdown to close the client and stop the loop thread.
+"""
+
+import asyncio
+from collections import defaultdict
+from threading import Lock, Thread
+
+import httpx
+
+from mastermind import RANDOM_NUMS_API_BASE_URL
+
+# The API won't hand out more than this many numbers in a single call
+MAX_NUMS_PER_REQUEST = 10_000
+
+FETCH_TIMEOUT_SECONDS = 10
+
+
+class RandomNumsFetcher:
+    """
+    Fetches random numbers from the API at base_url, coalescing requests for
+    the same bounds that arrive while an earlier call is still in flight.
+    """
+
+    def __init__(self, base_url=RANDOM_NUMS_API_BASE_URL, timeout=FETCH_TIMEOUT_SECONDS):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.upstream_calls = 0
+
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._start_lock = Lock()
+
+        # (lower_bound, upper_bound) -> list of (num_count, future) waiting
+        self._waiting = defaultdict(list)
+        self._draining = set()
+
+    def fetch(self, num_count=4, lower_bound=0, upper_bound=7):
+        """
+        Requests num_count random numbers between lower_bound and upper_bound.
+        Returns a concurrent.futures.Future that resolves to a list of
+        integers, like [1, 2, 3, 4].
+        """
+
+        self._start()
+
+        return asyncio.run_coroutine_threadsafe(
+            self._request(num_count, lower_bound, upper_bound),
+            self._loop,
+        )
+
+    async def fetch_async(self, num_count=4, lower_bound=0, upper_bound=7):
+        """Like fetch, but can be awaited from any event loop."""
+
+        return await asyncio.wrap_future(
+            self.fetch(num_count, lower_bound, upper_bound)
+        )
+
+    def _start(self):
+        """Starts the background event loop thread, if it isn't running."""
+
+        with self._start_lock:
+            if self._loop is not None:
+                return
+
+            self._loop = asyncio.new_event_loop()
+            self._thread = Thread(
+                target=self._loop.run_forever,
+                name="random-nums-fetcher",
+                daemon=True,
+            )
+            self._thread.start()
+
+    async def aclose(self):
+        """
+        Closes the shared client, and with it any open connections to the
+        API. Must be awaited on the background loop (see close). Returns None.
+        """
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def close(self, timeout=FETCH_TIMEOUT_SECONDS):
+        """
+        Closes the client with aclose, then stops the background loop and its
+        thread. A later fetch starts them up again. Returns None.
+        """
+
+        with self._start_lock:
+            if self._loop is None:
+                return
+
+            asyncio.run_coroutine_threadsafe(
+                self.aclose(),
+                self._loop,
+            ).result(timeout=timeout)
+
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=timeout)
+            self._loop.close()
+
+            self._loop = None
+            self._thread = None
+
+    async def _request(self, num_count, lower_bound, upper_bound):
+        """
+        Runs on the background loop. Queues up a request and makes sure the
+        queue for its bounds is being drained, then waits for the result.
+        """
+
+        key = (lower_bound, upper_bound)
+        future = self._loop.create_future()
+        self._waiting[key].append((num_count, future))
+
+        if key not in self._draining:
+            self._draining.add(key)
+            self._loop.create_task(self._drain(key))
+
+        return await future
+
+    async def _drain(self, key):
+        """
+        Runs on the background loop. Serves everything waiting for the given
+        bounds, one batched API call at a time, until nothing is left.
+        """
+
+        try:
+            while self._waiting[key]:
+                batch = self._take_batch(key)
+
+                try:
+                    nums = await self._fetch_upstream(
+                        sum(num_count for num_count, _ in batch),
+                        *key,
+                    )
+                except Exception as exc:
+                    # The traceback holds on to the client's coroutine frames,
+                    # which mustn't be cleaned up outside of this loop's thread
+                    exc = exc.with_traceback(None)
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(exc)
+                    continue
+
+                # Hand each request its own slice of the numbers. Anyone who
+                # gave up waiting (their future was cancelled) is skipped.
+                start = 0
+                for num_count, future in batch:
+                    if not future.done():
+                        future.set_result(nums[start:start + num_count])
+                    start += num_count
+        finally:
+            self._draining.discard(key)
+
+    def _take_batch(self, key):
+        """
+        Removes and returns as many waiting requests for key as fit in one
+        API call (always at least one).
+        """
+
+        waiting = self._waiting[key]
+        total = 0
+        size = 0
+
+        while size < len(waiting) and (
+            size == 0 or total + waiting[size][0] <= MAX_NUMS_PER_REQUEST
+        ):
+            total += waiting[size][0]
+            size += 1
+
+        batch = waiting[:size]
+        del waiting[:size]
+
+        return batch
+
+    async def _fetch_upstream(self, num_count, lower_bound, upper_bound):
+        """
+        Makes a single call to the API for num_count random numbers. Returns
+        them as a list of integers.
+        """
+
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+
+        self.upstream_calls += 1
+        response = await self._client.get(
+            self.base_url,
+            params={
+                "num": num_count,
+                "min": lower_bound,
+                "max": upper_bound,
+                "col": 1,
+                "base": 10,
+                "format": "plain",
+                "rnd": "new",
+            },
+        )
+        response.raise_for_status()
+
+        return [int(s) for s in response.text.splitlines()]
+
+
+# Shared by every request handled by this process
+random_fetcher = RandomNumsFetcher()
@@ -0,0 +1,91 @@
+"""
+An in-process cache of the state of games that are still being played.
+
+While a game is active, every request to /play or /submit-guess needs its
+guesses and their feedback. Keeping its GameState here means we don't have to
+load the guess_history relationship from the database on each of those
+requests.
+
+Each worker process has its own cache. Entries are dropped as soon as a game
+ends or once they've gone unused for ACTIVE_GAME_TTL_SECONDS, and anything
+missing is simply reloaded from the database.
+"""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+
+# How long an active game can go untouched before we drop it from the cache.
+ACTIVE_GAME_TTL_SECONDS = 30 * 60
+
+class ActiveGameCache:
+    """
+    Thread-safe mapping of game_id -> GameState, ordered from least to most
+    recently used so expired entries can be swept from the front. Also used
+    for race rooms, as anything with a last_used attribute can be cached.
+    """
+
+    def __init__(self, ttl_seconds=ACTIVE_GAME_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._games = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._games)
+
+    def get(self, game_id):
+        """
+        Returns the GameState cached for game_id and marks it as recently
+        used, or returns None if it isn't cached (or has expired).
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            self._evict_expired(now)
+
+            game_state = self._games.get(game_id)
+            if game_state is not None:
+                game_state.last_used = now
+                self._games.move_to_end(game_id)
+
+            return game_state
+
+    def add(self, game_id, game_state):
+        """Caches game_state under game_id. Returns None."""
+
+        with self._lock:
+            now = time.monotonic()
+            self._evict_expired(now)
+
+            game_state.last_used = now
+            self._games[game_id] = game_state
+            self._games.move_to_end(game_id)
+
+    def evict(self, game_id):
+        """Drops game_id from the cache, if present. Returns None."""
+
+        with self._lock:
+            self._games.pop(game_id, None)
+
+    def clear(self):
+        """Drops every cached game. Returns None."""
+
+        with self._lock:
+            self._games.clear()
+
+    def _evict_expired(self, now):
+        """
+        Drops games that haven't been used within the TTL. As games are kept
+        in order of use, we can stop at the first one that hasn't expired.
+        Expects the lock to already be held.
+        """
+
+        while self._games:
+            game_id, game_state = next(iter(self._games.items()))
+            if now - game_state.last_used < self.ttl_seconds:
+                break
+            del self._games[game_id]
+
+
+# The cache shared across requests within this process
+active_games = ActiveGameCache()
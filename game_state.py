@@ -0,0 +1,244 @@
+"""
+A compact, in-memory value type for a game's state, so a worker process can
+hold a great many active games at once.
+
+A hydrated MastermindGame carries SQLAlchemy's instance state, a MutableList
+answer and a Guess row for every guess, which adds up to kilobytes per game.
+A GameState packs the answer and every guess into integers (see codes.py) and
+keeps the history in two arrays, so it takes a few hundred bytes. Guesses are
+scored and applied to the state directly, and the model is brought up to date
+from it afterwards.
+
+See benchmark_memory.py for how the two compare.
+"""
+
+import time
+from array import array
+from collections import namedtuple
+
+from codes import pack_code, score_code, unpack_code
+
+# How many guesses a player gets before the game is over
+MAX_GUESSES = 10
+
+# Has the same attributes the templates use on a Guess instance, so either can
+# be rendered in the guess history.
+GuessRecord = namedtuple(
+    "GuessRecord",
+    ["numbers_guessed", "correct_num_count", "correct_location_count"],
+)
+
+
+class GameState:
+    """
+    The state of a single game: its board, packed answer, whether it's been
+    won or is over, and its guess history. The history is an array of packed
+    guesses and a parallel array of feedback keys, where each key is
+    correct_nums * (num_count + 1) + correct_locations.
+    """
+
+    __slots__ = (
+        "game_id",
+        "num_count",
+        "lower_bound",
+        "upper_bound",
+        "packed_answer",
+        "has_won",
+        "game_over",
+        "packed_guesses",
+        "feedback_keys",
+        "last_used",
+    )
+
+    def __init__(
+        self,
+        game_id,
+        packed_answer,
+        num_count=4,
+        lower_bound=0,
+        upper_bound=7,
+        has_won=False,
+        game_over=False,
+    ):
+        self.game_id = game_id
+        self.num_count = num_count
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+        self.packed_answer = packed_answer
+        self.has_won = has_won
+        self.game_over = game_over
+        self.packed_guesses = array("L")
+        self.feedback_keys = array("H")
+        self.last_used = time.monotonic()
+
+    def __len__(self):
+        return len(self.packed_guesses)
+
+    @classmethod
+    def from_game(cls, game, newer_guesses=()):
+        """
+        Returns a new GameState for a MastermindGame, with the guess history
+        from its snapshot followed by newer_guesses, the Guess instances made
+        since the snapshot was taken (oldest first).
+        """
+
+        state = cls(
+            game.id,
+            pack_code(game.answer, game.lower_bound, game.upper_bound),
+            game.num_count,
+            game.lower_bound,
+            game.upper_bound,
+            game.has_won,
+            game.game_over,
+        )
+
+        if game.snapshot is not None:
+            state.load_snapshot(game.snapshot)
+
+        for guess in newer_guesses:
+            state.append(
+                pack_code(guess.numbers_guessed, game.lower_bound, game.upper_bound),
+                guess.correct_num_count,
+                guess.correct_location_count,
+            )
+
+        return state
+
+    def copy(self):
+        """
+        Returns a new GameState with the same board, answer, outcome and guess
+        history, which can be changed without affecting this one.
+        """
+
+        state = GameState(
+            self.game_id,
+            self.packed_answer,
+            self.num_count,
+            self.lower_bound,
+            self.upper_bound,
+            self.has_won,
+            self.game_over,
+        )
+        state.packed_guesses = array("L", self.packed_guesses)
+        state.feedback_keys = array("H", self.feedback_keys)
+
+        return state
+
+    def apply_to(self, game):
+        """
+        Brings a MastermindGame's version, has_won and game_over up to date
+        with this state. Returns None.
+        """
+
+        game.version = len(self)
+        game.has_won = self.has_won
+        game.game_over = self.game_over
+
+    def append(self, packed_guess, correct_nums, correct_locations):
+        """Records a guess and its feedback. Returns None."""
+
+        self.packed_guesses.append(packed_guess)
+        self.feedback_keys.append(
+            correct_nums * (self.num_count + 1) + correct_locations
+        )
+
+    def score(self, packed_guess):
+        """
+        Scores a packed guess against the answer. Returns a tuple of the
+        correct number count and the correct location count.
+        """
+
+        return score_code(
+            self.packed_answer,
+            packed_guess,
+            self.num_count,
+            self.lower_bound,
+            self.upper_bound,
+        )
+
+    def make_guess(self, packed_guess, feedback=None):
+        """
+        Makes a packed guess: scores it (unless its (correct_nums,
+        correct_locations) feedback is passed in), records it, and ends the
+        game if it was correct or there are no guesses left.
+
+        Returns the guess's feedback.
+        """
+
+        if feedback is None:
+            feedback = self.score(packed_guess)
+
+        correct_nums, correct_locations = feedback
+        self.append(packed_guess, correct_nums, correct_locations)
+
+        if correct_locations == self.num_count:
+            self.has_won = True
+            self.game_over = True
+        elif len(self) >= MAX_GUESSES:
+            self.game_over = True
+
+        return feedback
+
+    def feedback_at(self, index):
+        """
+        Returns the (correct_nums, correct_locations) feedback for the guess
+        made at the given (zero-based) index. Raises IndexError if there's no
+        such guess.
+        """
+
+        return divmod(self.feedback_keys[index], self.num_count + 1)
+
+    @property
+    def feedback(self):
+        """
+        Returns the feedback for every guess in the order they were made, as
+        a list of (correct_nums, correct_locations) tuples.
+        """
+
+        return [
+            divmod(key, self.num_count + 1)
+            for key in self.feedback_keys
+        ]
+
+    def history_record(self, index):
+        """
+        Returns the GuessRecord for the guess made at the given (zero-based)
+        index. Raises IndexError if there's no such guess.
+        """
+
+        correct_nums, correct_locations = self.feedback_at(index)
+
+        return GuessRecord(
+            unpack_code(
+                self.packed_guesses[index],
+                self.num_count,
+                self.lower_bound,
+                self.upper_bound,
+            ),
+            correct_nums,
+            correct_locations,
+        )
+
+    def to_snapshot(self):
+        """
+        Returns a compact, JSON-friendly snapshot of the guess history, like:
+
+        {"guesses": [[668, 2, 1], ...]}
+        """
+
+        return {
+            "guesses": [
+                [packed_guess, correct_nums, correct_locations]
+                for packed_guess, (correct_nums, correct_locations)
+                in zip(self.packed_guesses, self.feedback)
+            ],
+        }
+
+    def load_snapshot(self, snapshot):
+        """
+        Records the guess history from a snapshot, after any guesses already
+        recorded. Returns None.
+        """
+
+        for packed_guess, correct_nums, correct_locations in snapshot["guesses"]:
+            self.append(packed_guess, correct_nums, correct_locations)
@@ -0,0 +1,93 @@
+"""
+A small, thread-safe, bounded least-recently-used cache, shared by the
+various in-process caches in the app.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+# Returned by get() when a key isn't cached, so None can be a cached value
+MISSING = object()
+
+
+class LRUCache:
+    """
+    Maps keys to values, holding at most maxsize entries. Once full, adding a
+    new key evicts whichever entry was used least recently.
+
+    If sizeof is given, it's called on each value to weigh it (in bytes, say),
+    and maxsize bounds the total weight of the values rather than how many
+    there are.
+    """
+
+    def __init__(self, maxsize=1024, sizeof=None):
+        self.maxsize = maxsize
+        self.sizeof = sizeof
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=MISSING):
+        """
+        Returns the value cached for key and marks it as recently used, or
+        returns default if key isn't cached.
+        """
+
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        """
+        Caches value under key, evicting the least recently used entries
+        until the cache is no longer over maxsize. Returns None.
+        """
+
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._weigh(self._entries[key])
+
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self.size += self._weigh(value)
+
+            while self.size > self.maxsize:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= self._weigh(evicted)
+
+    def pop(self, key, default=None):
+        """Removes key from the cache and returns its value, or default."""
+
+        with self._lock:
+            if key not in self._entries:
+                return default
+
+            value = self._entries.pop(key)
+            self.size -= self._weigh(value)
+            return value
+
+    def clear(self):
+        """Removes every entry from the cache. Returns None."""
+
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _weigh(self, value):
+        """Returns how much value counts towards maxsize."""
+
+        if self.sizeof is None:
+            return 1
+
+        return self.sizeof(value)
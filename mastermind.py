@@ -1,20 +1,74 @@
-from sqlalchemy import ARRAY
+from sqlalchemy import ARRAY, REAL, event, tuple_, update
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.mutable import MutableList
 import requests
 
 from datetime import datetime
-from collections import Counter
+from collections import Counter, namedtuple
 
 from db import db
+from codes import pack_code, unpack_code
+from game_cache import active_games
+from game_state import GameState, GuessRecord, MAX_GUESSES
+from analytics import analyze_guess, is_tracked, replay_candidates
+from stats import GameResultCount
+from daily import DailyChallenge, today
+from lru import LRUCache, MISSING
+from metrics import metrics
+from tasks import run_after_commit, submit_after_commit
 
 RANDOM_NUMS_API_BASE_URL = "https://www.random.org/integers/"
 
+# How many guesses can be made between snapshots of a game's guess history
+SNAPSHOT_EVERY_GUESSES = 5
+
+# Scores are cached per worker process, keyed by board and the answer and
+# guess packed together. Set SCORE_CACHE_SIZE in the environment to change
+# how many are kept.
+SCORE_CACHE_SIZE = 100_000
+score_cache = LRUCache(maxsize=SCORE_CACHE_SIZE)
+
+# The codes that could still be the answer after a game's latest analysed
+# guess, keyed by (game_id, guess_count), so the analytics task for its next
+# guess can start from them rather than replaying the history. Only the tasks
+# themselves use it, so they never touch a game's cached GameState. It's
+# bounded by the arrays' total size, as one for a 6 number board can be
+# hundreds of kilobytes where one for the default board is a few at most.
+GUESS_CANDIDATES_CACHE_BYTES = 64 * 1024 * 1024
+guess_candidates = LRUCache(
+    maxsize=GUESS_CANDIDATES_CACHE_BYTES,
+    sizeof=lambda candidates: candidates.nbytes,
+)
+
+# How many guesses are shown at a time, latest first, in a game's history
+GUESS_HISTORY_PAGE_SIZE = 10
+
+# One page of a game's guess history: its Guess instances (oldest first), the
+# (one-based) number of the first of them, and the cursor for the page before
+# it, or None if this is the first page
+GuessPage = namedtuple("GuessPage", ["guesses", "first_number", "older_cursor"])
+
 
 class MastermindGame(db.Model):
     "The Mastermind game."
 
     __tablename__ = 'mastermind_games'
 
+    # Finished games are only ever looked up in bulk (e.g. for archiving), so
+    # a partial index keeps that cheap without bloating the index for the
+    # games still being played
+    __table_args__ = (
+        db.Index(
+            "ix_mastermind_games_finished",
+            "id",
+            postgresql_where=db.text("game_over"),
+        ),
+    )
+
+    # If set, called in place of the random numbers API to make answers, like
+    # a SeededRandomNums for reproducible load tests
+    random_nums_source = None
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -58,6 +112,42 @@ class MastermindGame(db.Model):
         default=False,
     )
 
+    # Set for daily challenge games, which share their answer with every
+    # other daily challenge game on the same date with the same num_count
+    daily_challenge_date = db.Column(
+        db.Date,
+        nullable=True,
+    )
+
+    # Incremented with every guess, so this is also the number of guesses
+    # made. The mapper args below make SQLAlchemy check it on each UPDATE, so
+    # if two requests try to make a guess from the same version of the game,
+    # only one of them succeeds (without having to lock the row).
+    version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    # A compact snapshot of the first snapshot_version guesses, taken every
+    # SNAPSHOT_EVERY_GUESSES guesses. Guesses are only ever appended, so the
+    # history can be rebuilt from the snapshot plus the few guesses made since.
+    snapshot_version = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    snapshot = db.Column(
+        JSONB,
+        nullable=True,
+    )
+
+    __mapper_args__ = {
+        "version_id_col": version,
+        "version_id_generator": False,
+    }
+
     guess_history = db.relationship(
         'Guess',
         order_by='Guess.occurred_at.asc()',
@@ -68,10 +158,23 @@ class MastermindGame(db.Model):
         return f"<MastermindGame #{self.id}, answer: {self.answer}>"
 
     @classmethod
-    def generate_new_game(cls, num_count=4, lower_bound=0, upper_bound=7):
-        """Creates and returns a new instance of the MastermindGame class."""
+    def generate_new_game(
+        cls,
+        num_count=4,
+        lower_bound=0,
+        upper_bound=7,
+        random_nums=None,
+    ):
+        """
+        Creates and returns a new instance of the MastermindGame class.
+
+        Its answer is random_nums if they're passed in (say, if they were
+        fetched ahead of time), or else freshly fetched random numbers.
+        """
+
+        if random_nums is None:
+            random_nums = cls._fetch_random_nums(num_count)
 
-        random_nums = cls._fetch_random_nums(num_count)
         new_game = MastermindGame(
             answer=random_nums,
             num_count=num_count,
@@ -81,6 +184,34 @@ class MastermindGame(db.Model):
         db.session.add(new_game)
         return new_game
 
+    @classmethod
+    def generate_daily_game(cls, num_count=4, lower_bound=0, upper_bound=7):
+        """
+        Creates and returns a new instance of the MastermindGame class for
+        today's daily challenge. Its answer is the same as every other daily
+        challenge game today with the same num_count.
+        """
+
+        daily_date = today()
+        answer = DailyChallenge.get_answer(
+            daily_date,
+            num_count,
+            lambda num_count: cls._fetch_random_nums(
+                num_count,
+                lower_bound,
+                upper_bound,
+            ),
+        )
+        new_game = MastermindGame(
+            answer=list(answer),
+            num_count=num_count,
+            lower_bound=lower_bound,
+            upper_bound=upper_bound,
+            daily_challenge_date=daily_date,
+        )
+        db.session.add(new_game)
+        return new_game
+
     @classmethod
     def _fetch_random_nums(cls, num_count=4, lower_bound=0, upper_bound=7):
         """
@@ -90,8 +221,13 @@ class MastermindGame(db.Model):
         the defaults will be 0 and 7, respectively.
 
         Returns fetched numbers in an array of integers, like: [1,2,3,4]
+
+        If random_nums_source is set, the numbers come from it instead.
         """
 
+        if cls.random_nums_source is not None:
+            return cls.random_nums_source(num_count, lower_bound, upper_bound)
+
         response = requests.get(
             RANDOM_NUMS_API_BASE_URL,
             params={
@@ -116,7 +252,41 @@ class MastermindGame(db.Model):
         Determines how many guesses are remaining for the current game instance.
         Returns this number as an integer.
         """
-        return 10 - len(self.guess_history)
+        return MAX_GUESSES - self.guess_count
+
+    @property
+    def guess_count(self):
+        """
+        Determines how many guesses have been made for the current game
+        instance. Returns this number as an integer.
+        """
+        return len(self._get_game_state())
+
+    @property
+    def history(self):
+        """
+        Returns this game's guesses in the order they were made, as a list of
+        GuessRecords (which have the same attributes as Guess instances), like:
+
+        [GuessRecord(numbers_guessed=[1, 1, 1, 1], correct_num_count=1, ...)]
+
+        Reads from the in-process cache of active games, so this avoids loading
+        guess_history from the database while the game is being played.
+        """
+
+        return [
+            self.get_history_record(index)
+            for index in range(self.guess_count)
+        ]
+
+    def get_history_record(self, index):
+        """
+        Returns the GuessRecord for the guess made at the given (zero-based)
+        index of this game's history. Raises IndexError if there's no such
+        guess.
+        """
+
+        return self._get_game_state().history_record(index)
 
     @property
     def feedback(self):
@@ -127,16 +297,130 @@ class MastermindGame(db.Model):
         ["All incorrect.", "2 correct number(s) and 1 correct location(s), ..."]
         """
 
-        feedback = []
+        return [
+            self._generate_feedback_text(correct_nums, correct_locations)
+            for correct_nums, correct_locations
+            in self._get_game_state().feedback
+        ]
+
+    def _get_game_state(self):
+        """
+        Returns the GameState holding this instance's guess history.
+
+        That's the one kept on this instance, if a guess has been made on it
+        (see handle_guess) or the game is over. Otherwise it's the cached one,
+        or on a cache miss, one rebuilt from the latest snapshot plus the
+        guesses made since. It is only put back into the cache if the game is
+        still being played; otherwise it's kept on this instance until the
+        session commits or rolls back.
+        """
+
+        game_state = getattr(self, "_game_state", None)
+
+        if game_state is not None:
+            return game_state
+
+        game_state = active_games.get(self.id)
+
+        # Another worker process may have made a guess since we cached this
+        if game_state is not None and len(game_state) != self.version:
+            active_games.evict(self.id)
+            game_state = None
+
+        if game_state is None:
+            game_state = self._rebuild_game_state()
+
+            if self.game_over:
+                self._game_state = game_state
+            else:
+                active_games.add(self.id, game_state)
+
+        return game_state
+
+    def _rebuild_game_state(self):
+        """
+        Returns a new GameState built from this game's latest snapshot, with
+        the (at most SNAPSHOT_EVERY_GUESSES) guesses made since replayed on
+        top of it. Those are found by their seq, so loading them costs the
+        same however many guesses came before.
+        """
+
+        newer_guesses = (
+            Guess.query
+            .filter(
+                Guess.game_id == self.id,
+                Guess.seq > self.snapshot_version,
+            )
+            .order_by(Guess.seq)
+        )
+
+        return GameState.from_game(self, newer_guesses)
+
+    def get_guess_page(self, before=None, page_size=GUESS_HISTORY_PAGE_SIZE):
+        """
+        Returns a GuessPage of up to page_size guesses from this game's
+        history: the latest ones, or if before is the older_cursor of another
+        page, the ones made just before that page's.
+
+        Pages are found with keyset pagination over (occurred_at, id), so each
+        is a single index range scan however long the game has gone on.
 
-        for guess in self.guess_history:
-            text = self._generate_feedback_text(
-                guess.correct_num_count,
-                guess.correct_location_count
+        Raises ValueError if before isn't a valid cursor.
+        """
+
+        query = Guess.query.filter(Guess.game_id == self.id)
+
+        # The version counts the guesses made, so the latest page ends with
+        # guess number version
+        next_number = self.version + 1
+
+        if before is not None:
+            occurred_at, guess_id, next_number = self._parse_guess_cursor(before)
+            query = query.filter(
+                tuple_(Guess.occurred_at, Guess.id) < tuple_(occurred_at, guess_id)
             )
-            feedback.append(text)
 
-        return feedback
+        guesses = (
+            query
+            .order_by(Guess.occurred_at.desc(), Guess.id.desc())
+            .limit(page_size + 1)
+            .all()
+        )
+
+        has_older = len(guesses) > page_size
+        guesses = guesses[:page_size]
+        guesses.reverse()
+
+        first_number = next_number - len(guesses)
+        older_cursor = None
+
+        if has_older:
+            oldest = guesses[0]
+            older_cursor = f"{oldest.occurred_at.isoformat()},{oldest.id},{first_number}"
+
+        return GuessPage(guesses, first_number, older_cursor)
+
+    @staticmethod
+    def _parse_guess_cursor(cursor):
+        """
+        Takes in a cursor made by get_guess_page, and returns the
+        (occurred_at, id, number) of the guess it points at. Raises ValueError
+        if it isn't a valid cursor.
+        """
+
+        occurred_at, guess_id, number = cursor.split(",")
+
+        return datetime.fromisoformat(occurred_at), int(guess_id), int(number)
+
+    def get_feedback_text(self, index):
+        """
+        Returns the feedback string for the guess made at the given (zero-based)
+        index of this game's history, like: "All incorrect."
+        """
+
+        return self._generate_feedback_text(
+            *self._get_game_state().feedback_at(index)
+        )
 
     def _generate_feedback_text(self, correct_nums, correct_locations):
         """
@@ -167,14 +451,27 @@ class MastermindGame(db.Model):
 
         return True
 
-    def handle_guess(self, numbers_guessed):
+    def handle_guess(self, numbers_guessed, packed_guess=None):
         """
-        Takes in a list of numbers_guessed, scores them, and updates the game
+        Takes in a list of numbers_guessed (and optionally their packed code,
+        if it's already been worked out), scores them, and updates the game
         instance accordingly as outlined below. Returns None.
 
+        The guess is scored and made on a copy of the game's GameState, and
+        this instance is brought up to date from it. The cache of active games
+        is shared with other requests, so the copy only replaces the cached
+        GameState once the guess is committed.
+
         Always:
             - Scores the incoming guess by correct nums and correct locations
             - Creates a new Guess instance and adds to db session
+            - Once committed, annotates the Guess with analytics in the
+              background, for boards small enough to track
+
+        The game's version is incremented, so that if another request made a
+        guess from the same version first, flushing or committing this one
+        will raise StaleDataError. Every SNAPSHOT_EVERY_GUESSES guesses, and when the game
+        ends, a snapshot of the guess history is saved along with it.
 
         If this was their last remaining guess:
             - Sets game_over to True
@@ -182,24 +479,103 @@ class MastermindGame(db.Model):
         If their guess is correct:
             - Updates the has_won property to True
             - Sets game_over to True
+
+        If the game is now over:
+            - Drops the game from the cache of active games, once committed
+            - Counts the game's result towards the stats, in the same
+              transaction as the guess
         """
 
-        score = self.score_guess(numbers_guessed)
+        # Load the history before adding the new guess to the session, so a
+        # cache miss doesn't pick the new guess up from the database as well
+        game_state = self._get_game_state().copy()
+
+        if packed_guess is None:
+            packed_guess = pack_code(
+                numbers_guessed,
+                self.lower_bound,
+                self.upper_bound,
+            )
+
+        correct_nums, correct_locations = game_state.make_guess(
+            packed_guess,
+            self._score_new_guess(game_state, packed_guess),
+        )
+        game_state.apply_to(self)
+
+        # This instance sees the new guess straight away, but other requests
+        # only do once it's been committed
+        self._game_state = game_state
+        run_after_commit(_publish_game_state, self.id, game_state)
 
         # The below factory method calls db.session.add() for the new Guess
-        Guess.generate_new_guess(
+        new_guess = Guess.generate_new_guess(
             game_id=self.id,
+            seq=self.version,
             numbers_guessed=numbers_guessed,
-            correct_num_count=score["correct_nums"],
-            correct_location_count=score["correct_locations"]
+            correct_num_count=correct_nums,
+            correct_location_count=correct_locations,
+        )
+
+        # The game's row is being updated anyway, so the snapshot goes along
+        # with that same UPDATE
+        if self.version % SNAPSHOT_EVERY_GUESSES == 0 or self.game_over:
+            self.snapshot = game_state.to_snapshot()
+            self.snapshot_version = self.version
+
+        if is_tracked(self.num_count, self.lower_bound, self.upper_bound):
+            # Flush now (it'd all be written on commit anyway) so the new
+            # Guess's id is known for the analytics task
+            db.session.flush()
+            # The task gets its own copy of the history, as the GameState
+            # goes on being used by requests in the meantime
+            submit_after_commit(
+                _record_guess_analytics,
+                new_guess.id,
+                self.id,
+                tuple(game_state.packed_guesses),
+                tuple(game_state.feedback),
+                self.num_count,
+                self.lower_bound,
+                self.upper_bound,
+            )
+
+        # Count finished games' results towards the stats. That's done along
+        # with the final guess, so a game is counted exactly once.
+        if self.game_over:
+            GameResultCount.record_result(
+                self.num_count,
+                self.has_won,
+                len(game_state),
+            )
+
+    def _score_new_guess(self, game_state, packed_guess):
+        """
+        Scores a new packed guess against game_state's answer. Returns a
+        tuple of the correct number count and the correct location count.
+
+        Scores are looked up in score_cache first, so a guess that's already
+        been scored against the same answer (in a daily challenge game, say,
+        where everyone shares an answer) isn't scored again. Hits and misses
+        are counted in the metrics.
+        """
+
+        base = self.upper_bound - self.lower_bound + 1
+        key = (
+            self.num_count,
+            base,
+            game_state.packed_answer * base ** self.num_count + packed_guess,
         )
+        score = score_cache.get(key)
 
-        if self.remaining_guesses == 0:
-            self.game_over = True
+        if score is MISSING:
+            metrics.increment("score_cache_misses")
+            score = game_state.score(packed_guess)
+            score_cache.put(key, score)
+        else:
+            metrics.increment("score_cache_hits")
 
-        if score["won"]:
-            self.game_over = True
-            self.has_won = True
+        return score
 
     def score_guess(self, numbers_guessed):
         """
@@ -286,11 +662,53 @@ class MastermindGame(db.Model):
         }
 
 
+@event.listens_for(MastermindGame, "expire")
+def _drop_game_state(game, attrs):
+    # The session has committed or rolled back, so a guess made on this
+    # instance has either been published to the cache or thrown away, and
+    # the history is looked up afresh. (game is None if it's already been
+    # garbage collected.)
+    if game is not None:
+        game.__dict__.pop("_game_state", None)
+
+
+def _publish_game_state(game_id, game_state):
+    """
+    Replaces the cached GameState for game_id with game_state, now that the
+    guess made on it has been committed. Finished games are no longer on the
+    hot path, so they're dropped from the cache instead. Returns None.
+    """
+
+    if game_state.game_over:
+        active_games.evict(game_id)
+    else:
+        active_games.add(game_id, game_state)
+
+
 class Guess(db.Model):
     "An individual guess made for a particular game."
 
     __tablename__ = 'guesses'
 
+    # The first index supports loading a page of a game's guess history with
+    # keyset pagination, and the second loading the guesses made since a
+    # snapshot, each with an index range scan. The second also means a game
+    # can't have two guesses with the same number.
+    __table_args__ = (
+        db.Index(
+            "ix_guesses_game_id_occurred_at_id",
+            "game_id",
+            "occurred_at",
+            "id",
+        ),
+        db.Index(
+            "ix_guesses_game_id_seq",
+            "game_id",
+            "seq",
+            unique=True,
+        ),
+    )
+
     id = db.Column(
         db.Integer,
         primary_key=True,
@@ -302,6 +720,13 @@ class Guess(db.Model):
         nullable=False,
     )
 
+    # This guess's (one-based) number within its game, which is also the
+    # game's version once it was made
+    seq = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
     numbers_guessed = db.Column(
         MutableList.as_mutable(ARRAY(db.Integer)),
         nullable=False,
@@ -317,6 +742,24 @@ class Guess(db.Model):
         nullable=False,
     )
 
+    # Guess analytics: how many codes could still have been the answer before
+    # and after this guess, and the entropy (in bits) of how this guess splits
+    # those candidates up by feedback. Left null for boards too big to track.
+    candidates_before = db.Column(
+        db.Integer,
+        nullable=True,
+    )
+
+    candidates_after = db.Column(
+        db.Integer,
+        nullable=True,
+    )
+
+    feedback_entropy = db.Column(
+        REAL,
+        nullable=True,
+    )
+
     occurred_at = db.Column(
         db.DateTime,
         nullable=False,
@@ -329,13 +772,26 @@ class Guess(db.Model):
     def __repr__(self):
         return f"<Guess #{self.id} for game {self.game_id}, {self.numbers_guessed}>"
 
+    @property
+    def feedback_text(self):
+        """Returns the feedback string for this guess, like: "All incorrect." """
+
+        return self.game._generate_feedback_text(
+            self.correct_num_count,
+            self.correct_location_count,
+        )
+
     @classmethod
     def generate_new_guess(
         cls,
         game_id,
+        seq,
         numbers_guessed,
         correct_num_count,
         correct_location_count,
+        candidates_before=None,
+        candidates_after=None,
+        feedback_entropy=None,
     ):
         """
         Factory method to create and add a new instance of the Guess class.
@@ -343,8 +799,90 @@ class Guess(db.Model):
 
         new_guess = Guess(
             game_id=game_id,
+            seq=seq,
             numbers_guessed=numbers_guessed,
             correct_num_count=correct_num_count,
             correct_location_count=correct_location_count,
+            candidates_before=candidates_before,
+            candidates_after=candidates_after,
+            feedback_entropy=feedback_entropy,
         )
         db.session.add(new_guess)
+        return new_guess
+
+
+def _record_guess_analytics(
+    guess_id,
+    game_id,
+    packed_guesses,
+    feedback,
+    num_count,
+    lower_bound,
+    upper_bound,
+):
+    """
+    Works out the analytics for a game's latest guess, and saves them to its
+    Guess row in a transaction of its own. Runs in the background once the
+    guess is committed.
+
+    Takes in tuples of the game's packed guesses so far and their
+    (correct_nums, correct_locations) feedback, the last of which is the
+    guess being analysed.
+
+    The candidates left over from the previous guess are taken from
+    guess_candidates when they're there, and are only replayed from the
+    history otherwise. Unless this guess ended the game, the narrowed down
+    candidates are kept in turn for the next guess.
+    """
+
+    index = len(packed_guesses) - 1
+    candidates = guess_candidates.pop((game_id, index))
+
+    if candidates is None:
+        candidates = replay_candidates(
+            [
+                GuessRecord(
+                    unpack_code(packed_guess, num_count, lower_bound, upper_bound),
+                    correct_nums,
+                    correct_locations,
+                )
+                for packed_guess, (correct_nums, correct_locations) in zip(
+                    packed_guesses[:index],
+                    feedback[:index],
+                )
+            ],
+            num_count,
+            lower_bound,
+            upper_bound,
+        )
+
+    correct_nums, correct_locations = feedback[index]
+    analysis = analyze_guess(
+        candidates,
+        packed_guesses[index],
+        correct_nums,
+        correct_locations,
+        num_count,
+        lower_bound,
+        upper_bound,
+    )
+
+    # There's no next guess to keep them for once the game is over
+    game_over = (
+        correct_locations == num_count
+        or len(packed_guesses) >= MAX_GUESSES
+    )
+
+    if not game_over:
+        guess_candidates.put((game_id, index + 1), analysis.candidates)
+
+    db.session.execute(
+        update(Guess)
+        .where(Guess.id == guess_id)
+        .values(
+            candidates_before=analysis.candidates_before,
+            candidates_after=analysis.candidates_after,
+            feedback_entropy=analysis.feedback_entropy,
+        )
+    )
+    db.session.commit()
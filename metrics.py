@@ -0,0 +1,44 @@
+"""
+Simple in-process counters for keeping an eye on how the app is behaving,
+like how often concurrent guesses conflict. Each worker process keeps its own
+counts.
+"""
+
+from collections import Counter
+from threading import Lock
+
+
+class Metrics:
+    """A thread-safe set of named counters."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = Lock()
+
+    def increment(self, name, amount=1):
+        """Adds amount to the counter called name. Returns None."""
+
+        with self._lock:
+            self._counts[name] += amount
+
+    def get(self, name):
+        """Returns the current value of the counter called name."""
+
+        with self._lock:
+            return self._counts[name]
+
+    def snapshot(self):
+        """Returns a dictionary of every counter's current value."""
+
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        """Sets every counter back to zero. Returns None."""
+
+        with self._lock:
+            self._counts.clear()
+
+
+# The counters shared across requests within this process
+metrics = Metrics()
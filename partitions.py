@@ -0,0 +1,238 @@
+"""
+Precomputed feedback partition tables, for narrowing down candidate codes
+without scoring them.
+
+For a given board (num_count and bounds), the table holds, for every possible
+guess, every code on the board sorted by the feedback that guess would get if
+the code were the answer (and by code within each feedback). So the codes
+compatible with a (guess, feedback) pair are one contiguous, sorted slice,
+and narrowing a set of candidates down is an intersection with that slice.
+
+Tables are built once and saved to PARTITION_TABLE_DIR, then memory-mapped,
+so every worker process on a machine shares a single copy through the page
+cache. They're built on first use, or ahead of time with:
+
+    flask partitions build --num-count 4
+"""
+
+import os
+import tempfile
+from threading import Lock
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+
+from codes import all_codes, score_code_matrix
+
+# A table takes up (number of codes)^2 entries, so they're only kept for
+# boards with at most this many codes (32 MB for 4 numbers from 0 to 7)
+MAX_PARTITION_CODES = 8 ** 4
+
+# Guesses are scored a block at a time while building, with blocks of at
+# most this many (guess, code) pairs
+BUILD_BLOCK_SIZE = 1 << 20
+
+PARTITION_TABLE_DIR = os.environ.get(
+    "PARTITION_TABLE_DIR",
+    os.path.join(tempfile.gettempdir(), "mastermind-partitions"),
+)
+
+
+def has_partition_table(num_count=4, lower_bound=0, upper_bound=7):
+    """Returns whether a board of this size gets a partition table."""
+
+    return (upper_bound - lower_bound + 1) ** num_count <= MAX_PARTITION_CODES
+
+
+class PartitionTable:
+    """
+    The feedback partitions of every code on a board, for every guess.
+
+    codes_by_feedback has a row per guess, listing every code sorted by
+    feedback key (correct_nums * (num_count + 1) + correct_locations) then
+    by code. offsets has a row per guess too, where the codes with feedback
+    key k are codes_by_feedback[guess, offsets[guess, k]:offsets[guess, k + 1]].
+    """
+
+    def __init__(self, codes_by_feedback, offsets, num_count=4, lower_bound=0, upper_bound=7):
+        self.codes_by_feedback = codes_by_feedback
+        self.offsets = offsets
+        self.num_count = num_count
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+
+    @classmethod
+    def build(cls, num_count=4, lower_bound=0, upper_bound=7):
+        """Builds the table for a board in memory, and returns it."""
+
+        codes = all_codes(num_count, lower_bound, upper_bound)
+        code_count = len(codes)
+        key_count = (num_count + 1) ** 2
+
+        codes_by_feedback = np.empty(
+            (code_count, code_count),
+            dtype=np.uint16 if code_count <= 1 << 16 else np.uint32,
+        )
+        offsets = np.zeros((code_count, key_count + 1), dtype=np.uint32)
+        block_guesses = max(1, BUILD_BLOCK_SIZE // code_count)
+
+        for start in range(0, code_count, block_guesses):
+            guesses = codes[start:start + block_guesses]
+            nums, locations = score_code_matrix(
+                guesses,
+                codes,
+                num_count,
+                lower_bound,
+                upper_bound,
+            )
+            feedback_keys = nums * (num_count + 1) + locations
+
+            # Codes are their own indexes, so a stable argsort sorts them by
+            # feedback and then by code
+            rows = slice(start, start + len(guesses))
+            codes_by_feedback[rows] = np.argsort(feedback_keys, axis=1, kind="stable")
+
+            # Count each row's keys in one go by giving every row its own range
+            row_keys = feedback_keys + np.arange(len(guesses))[:, np.newaxis] * key_count
+            counts = np.bincount(
+                row_keys.ravel(),
+                minlength=len(guesses) * key_count,
+            ).reshape(len(guesses), key_count)
+            offsets[rows, 1:] = np.cumsum(counts, axis=1)
+
+        return cls(codes_by_feedback, offsets, num_count, lower_bound, upper_bound)
+
+    def save(self, directory=PARTITION_TABLE_DIR):
+        """
+        Saves the table's arrays to directory, replacing any saved before.
+        Each is written to a temporary file first, so a table being loaded
+        at the same time is never seen half-written. Returns None.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+
+        for name, array in self._arrays().items():
+            path = _table_path(directory, name, self.num_count, self.lower_bound, self.upper_bound)
+            temp_path = f"{path}.{os.getpid()}.tmp"
+
+            with open(temp_path, "wb") as file:
+                np.save(file, array)
+
+            os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, num_count=4, lower_bound=0, upper_bound=7, directory=PARTITION_TABLE_DIR):
+        """
+        Memory-maps a table saved to directory, and returns it. Raises
+        FileNotFoundError if it hasn't been saved.
+        """
+
+        arrays = {
+            name: np.load(
+                _table_path(directory, name, num_count, lower_bound, upper_bound),
+                mmap_mode="r",
+            )
+            for name in ("codes_by_feedback", "offsets")
+        }
+
+        return cls(**arrays, num_count=num_count, lower_bound=lower_bound, upper_bound=upper_bound)
+
+    def _arrays(self):
+        return {"codes_by_feedback": self.codes_by_feedback, "offsets": self.offsets}
+
+    def compatible_codes(self, packed_guess, correct_nums, correct_locations):
+        """
+        Returns the sorted array of every code that would give packed_guess
+        the feedback (correct_nums, correct_locations).
+        """
+
+        key = correct_nums * (self.num_count + 1) + correct_locations
+        start, end = self.offsets[packed_guess, key:key + 2]
+
+        return self.codes_by_feedback[packed_guess, start:end]
+
+    def partition(self, candidates, packed_guess, correct_nums, correct_locations):
+        """
+        Splits up the sorted array of candidates by the feedback packed_guess
+        would get from each. Returns an array of how many candidates fall
+        under each feedback key, and the sorted array of candidates that
+        would give the feedback (correct_nums, correct_locations).
+        """
+
+        is_candidate = np.zeros(len(self.codes_by_feedback), dtype=bool)
+        is_candidate[candidates] = True
+
+        # Lining the guess's row up against the candidates both counts every
+        # partition and intersects the candidates with the one we want
+        row_is_candidate = is_candidate[self.codes_by_feedback[packed_guess]]
+        candidates_so_far = np.concatenate(([0], np.cumsum(row_is_candidate)))
+        offsets = self.offsets[packed_guess]
+        partition_sizes = candidates_so_far[offsets[1:]] - candidates_so_far[offsets[:-1]]
+
+        key = correct_nums * (self.num_count + 1) + correct_locations
+        start, end = offsets[key:key + 2]
+        remaining = self.codes_by_feedback[packed_guess, start:end][
+            row_is_candidate[start:end]
+        ]
+
+        return partition_sizes, remaining.astype(np.uint32)
+
+
+def _table_path(directory, name, num_count, lower_bound, upper_bound):
+    return os.path.join(
+        directory,
+        f"{name}-{num_count}-{lower_bound}-{upper_bound}.npy",
+    )
+
+
+_tables = {}
+_tables_lock = Lock()
+
+
+def get_partition_table(num_count=4, lower_bound=0, upper_bound=7):
+    """
+    Returns the PartitionTable for a board, memory-mapping it from
+    PARTITION_TABLE_DIR (and building and saving it first, if need be).
+    Returns None if the board is too big to have one.
+
+    Each process keeps the tables it has loaded.
+    """
+
+    if not has_partition_table(num_count, lower_bound, upper_bound):
+        return None
+
+    key = (num_count, lower_bound, upper_bound)
+
+    with _tables_lock:
+        table = _tables.get(key)
+
+        if table is None:
+            try:
+                table = PartitionTable.load(num_count, lower_bound, upper_bound)
+            except FileNotFoundError:
+                PartitionTable.build(num_count, lower_bound, upper_bound).save()
+                table = PartitionTable.load(num_count, lower_bound, upper_bound)
+
+            _tables[key] = table
+
+    return table
+
+
+partitions_cli = AppGroup("partitions", help="Manage feedback partition tables.")
+
+
+@partitions_cli.command("build")
+@click.option("--num-count", default=4, show_default=True)
+@click.option("--lower-bound", default=0, show_default=True)
+@click.option("--upper-bound", default=7, show_default=True)
+def build_command(num_count, lower_bound, upper_bound):
+    """Build and save the partition table for a board."""
+
+    if not has_partition_table(num_count, lower_bound, upper_bound):
+        raise click.ClickException(
+            f"Boards with more than {MAX_PARTITION_CODES} codes don't get a partition table."
+        )
+
+    PartitionTable.build(num_count, lower_bound, upper_bound).save()
+    click.echo(f"Saved the partition table to {PARTITION_TABLE_DIR}")
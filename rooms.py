@@ -0,0 +1,672 @@
+"""
+Race rooms: many players racing to crack the same hidden combination.
+
+Play happens in rounds. Each player submits one guess per round, and once
+every player still in the race has submitted (or the round is ended early),
+all of the round's guesses are scored together in one vectorized call and
+saved with a single bulk insert.
+
+Rooms live in memory in the worker process that's hosting them, and their
+state is snapshotted to the database every few rounds. A room that isn't in
+memory (say, after a restart, or once it's gone unused for
+RACE_ROOM_TTL_SECONDS) is rebuilt from its latest snapshot plus the guesses
+saved since.
+
+The database has the final say on how many rounds have been played: a round
+is only saved if nobody else has saved it first, and a room in memory is only
+moved on to the next round once that's committed. A room is rebuilt whenever
+another worker process has played a round of it (or had a player join) since
+it was loaded. Queued guesses are only held by the worker they were submitted
+to, though, so a room is best served by a single worker; guesses queued for a
+round another worker plays first are dropped.
+"""
+
+import time
+from datetime import datetime
+from threading import Lock
+
+import numpy as np
+from sqlalchemy import ARRAY, func, select
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.exc import IntegrityError
+
+from db import db
+from codes import pack_code, unpack_code, score_codes
+from game_cache import ActiveGameCache
+from metrics import metrics
+
+MAX_GUESSES_PER_PLAYER = 10
+
+# How many rounds can pass between snapshots of a room's state
+SNAPSHOT_EVERY_ROUNDS = 5
+
+# How long a room can go untouched before we drop it from memory
+RACE_ROOM_TTL_SECONDS = 30 * 60
+
+
+class RaceRoomRecord(db.Model):
+    """A race room, with a periodic snapshot of its in-memory state."""
+
+    __tablename__ = 'race_rooms'
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+        autoincrement=True,
+    )
+
+    num_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=4,
+    )
+
+    lower_bound = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    upper_bound = db.Column(
+        db.Integer,
+        nullable=False,
+        default=7,
+    )
+
+    answer = db.Column(
+        ARRAY(db.Integer),
+        nullable=False,
+    )
+
+    # The number of rounds played. Saving a round only succeeds if this is
+    # still what it was when the round was scored, so a round can't be saved
+    # twice (by two worker processes, say).
+    round = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    # The number of rounds already played when the snapshot was taken
+    snapshot_round = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    snapshot = db.Column(
+        JSONB,
+        nullable=True,
+    )
+
+    created_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.utcnow,
+    )
+
+    def __repr__(self):
+        return f"<RaceRoomRecord #{self.id}, answer: {self.answer}>"
+
+
+class RaceRoomPlayer(db.Model):
+    """A player who has joined a race room."""
+
+    __tablename__ = 'race_room_players'
+
+    room_id = db.Column(
+        db.Integer,
+        db.ForeignKey('race_rooms.id', ondelete="cascade"),
+        primary_key=True,
+    )
+
+    player_id = db.Column(
+        db.Text,
+        primary_key=True,
+    )
+
+    name = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    def __repr__(self):
+        return f"<RaceRoomPlayer {self.name} in room {self.room_id}>"
+
+
+class RaceGuess(db.Model):
+    """A guess made by a player in a particular round of a race room."""
+
+    __tablename__ = 'race_guesses'
+
+    # A player only gets one guess per round
+    __table_args__ = (
+        db.Index(
+            "ix_race_guesses_room_id_round_player_id",
+            "room_id",
+            "round",
+            "player_id",
+            unique=True,
+        ),
+    )
+
+    id = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    room_id = db.Column(
+        db.Integer,
+        db.ForeignKey('race_rooms.id', ondelete="cascade"),
+        nullable=False,
+    )
+
+    round = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    player_id = db.Column(
+        db.Text,
+        nullable=False,
+    )
+
+    packed_guess = db.Column(
+        db.Integer,
+        nullable=False,
+    )
+
+    correct_num_count = db.Column(
+        db.SmallInteger,
+        nullable=False,
+    )
+
+    correct_location_count = db.Column(
+        db.SmallInteger,
+        nullable=False,
+    )
+
+    def __repr__(self):
+        return f"<RaceGuess #{self.id} for room {self.room_id}, round {self.round}>"
+
+
+class RacePlayer:
+    """One player's progress in a race room."""
+
+    __slots__ = ("name", "guesses", "has_won")
+
+    def __init__(self, name, guesses=None, has_won=False):
+        self.name = name
+        # A list of (packed_guess, correct_nums, correct_locations) tuples
+        self.guesses = guesses or []
+        self.has_won = has_won
+
+    @property
+    def is_finished(self):
+        return self.has_won or len(self.guesses) >= MAX_GUESSES_PER_PLAYER
+
+
+class RaceRoom:
+    """
+    The in-memory state of a race room: its players, their guesses, and the
+    guesses waiting to be scored in the current round.
+    """
+
+    def __init__(self, room_id, answer, num_count=4, lower_bound=0, upper_bound=7):
+        self.id = room_id
+        self.answer = list(answer)
+        self.num_count = num_count
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+        self.packed_answer = pack_code(answer, lower_bound, upper_bound)
+
+        self.round = 0
+        self.players = {}
+        self.pending = {}
+        self.last_used = time.monotonic()
+        self._lock = Lock()
+
+        # Held while a round is played and saved, so rounds are saved in order
+        self.round_lock = Lock()
+
+    def join(self, player_id, name):
+        """
+        Adds a player to the room. Returns True if they're new to the room,
+        or False if they'd already joined.
+        """
+
+        with self._lock:
+            if player_id in self.players:
+                return False
+
+            self.players[player_id] = RacePlayer(name)
+            return True
+
+    def submit_guess(self, player_id, numbers_guessed):
+        """
+        Queues a player's guess for the current round, replacing any guess
+        they already queued. Returns True if every player still in the race
+        has now submitted, meaning the round is ready to be played.
+
+        Raises ValueError if the player isn't in the room or has finished.
+        """
+
+        with self._lock:
+            player = self.players.get(player_id)
+
+            if player is None or player.is_finished:
+                raise ValueError()
+
+            self.pending[player_id] = pack_code(
+                numbers_guessed,
+                self.lower_bound,
+                self.upper_bound,
+            )
+
+            return len(self.pending) == len(self.racing_players())
+
+    def racing_players(self):
+        """Returns the ids of players who are still in the race."""
+
+        return [
+            player_id for player_id, player in self.players.items()
+            if not player.is_finished
+        ]
+
+    def play_round(self):
+        """
+        Scores every guess queued for the current round, records the results
+        and starts a new round. Returns the round's rows, as score_round does.
+        """
+
+        rows = self.score_round()
+        self.finish_round(rows)
+
+        return rows
+
+    def score_round(self):
+        """
+        Scores every guess queued for the current round against the answer in
+        a single vectorized call, without recording the results.
+
+        Returns a list of dictionaries for the round's guesses, ready to be
+        bulk inserted as RaceGuess rows. Returns an empty list if no guesses
+        were queued.
+        """
+
+        with self._lock:
+            if not self.pending:
+                return []
+
+            player_ids = list(self.pending)
+            packed_guesses = np.fromiter(
+                self.pending.values(),
+                dtype=np.uint32,
+                count=len(player_ids),
+            )
+
+            # Scoring is symmetric, so scoring the answer against every guess
+            # gives the same counts as scoring every guess against the answer
+            correct_nums, correct_locations = score_codes(
+                packed_guesses,
+                self.packed_answer,
+                self.num_count,
+                self.lower_bound,
+                self.upper_bound,
+            )
+
+            return [
+                {
+                    "room_id": self.id,
+                    "round": self.round,
+                    "player_id": player_id,
+                    "packed_guess": packed_guess,
+                    "correct_num_count": nums,
+                    "correct_location_count": locations,
+                }
+                for player_id, packed_guess, nums, locations in zip(
+                    player_ids,
+                    packed_guesses.tolist(),
+                    correct_nums.tolist(),
+                    correct_locations.tolist(),
+                )
+            ]
+
+    def finish_round(self, rows):
+        """
+        Records the results of a round scored by score_round and starts a new
+        round. Does nothing if there were no rows. Returns None.
+
+        Guesses can be queued while the round is being saved, so only the
+        guesses that were scored are taken off the queue. Anything queued (or
+        replaced) since is left for the next round, unless its player has now
+        finished.
+        """
+
+        if not rows:
+            return
+
+        with self._lock:
+            for row in rows:
+                player_id = row["player_id"]
+                self._record_guess(
+                    player_id,
+                    row["packed_guess"],
+                    row["correct_num_count"],
+                    row["correct_location_count"],
+                )
+
+                if (
+                    self.pending.get(player_id) == row["packed_guess"]
+                    or self.players[player_id].is_finished
+                ):
+                    self.pending.pop(player_id, None)
+
+            self.round += 1
+
+    def _record_guess(self, player_id, packed_guess, nums, locations):
+        """Adds a scored guess to a player's history. Expects the lock held."""
+
+        player = self.players[player_id]
+        player.guesses.append((packed_guess, nums, locations))
+
+        if locations == self.num_count:
+            player.has_won = True
+
+    def standings(self):
+        """
+        Returns a list of dictionaries describing each player's progress,
+        with winners first (fewest guesses first), like:
+
+        [{"name": "Ada", "guess_count": 4, "has_won": True, ...}, ...]
+        """
+
+        with self._lock:
+            standings = [
+                {
+                    "player_id": player_id,
+                    "name": player.name,
+                    "guess_count": len(player.guesses),
+                    "has_won": player.has_won,
+                    "is_finished": player.is_finished,
+                    "has_submitted": player_id in self.pending,
+                }
+                for player_id, player in self.players.items()
+            ]
+
+        return sorted(
+            standings,
+            key=lambda s: (not s["has_won"], s["guess_count"], s["name"]),
+        )
+
+    def feedback_for(self, player_id):
+        """
+        Returns a list of (numbers_guessed, correct_nums, correct_locations)
+        tuples for each of a player's guesses so far.
+        """
+
+        with self._lock:
+            player = self.players.get(player_id)
+            guesses = list(player.guesses) if player else []
+
+        return [
+            (
+                unpack_code(
+                    packed_guess,
+                    self.num_count,
+                    self.lower_bound,
+                    self.upper_bound,
+                ),
+                nums,
+                locations,
+            )
+            for packed_guess, nums, locations in guesses
+        ]
+
+    def to_snapshot(self, round_rows=()):
+        """
+        Returns a JSON-friendly dictionary of the number of rounds played and
+        every player's guesses so far, like:
+
+        {"round": 3, "guesses": {"player-id": [[668, 2, 1], ...], ...}}
+
+        If the rows of a round scored by score_round are passed in, it's a
+        snapshot of the room as it will be once that round is finished.
+        """
+
+        with self._lock:
+            snapshot = {
+                "round": self.round,
+                "guesses": {
+                    player_id: list(player.guesses)
+                    for player_id, player in self.players.items()
+                },
+            }
+
+        for row in round_rows:
+            snapshot["guesses"][row["player_id"]].append((
+                row["packed_guess"],
+                row["correct_num_count"],
+                row["correct_location_count"],
+            ))
+
+        if round_rows:
+            snapshot["round"] += 1
+
+        return snapshot
+
+    @classmethod
+    def from_record(cls, record):
+        """
+        Rebuilds a RaceRoom from its RaceRoomRecord: starting from the latest
+        snapshot, then replaying the guesses saved since it was taken.
+        """
+
+        room = cls(
+            record.id,
+            record.answer,
+            record.num_count,
+            record.lower_bound,
+            record.upper_bound,
+        )
+        room.round = record.snapshot_round
+        snapshot_guesses = (record.snapshot or {}).get("guesses", {})
+
+        for player in RaceRoomPlayer.query.filter_by(room_id=record.id):
+            guesses = [
+                tuple(guess)
+                for guess in snapshot_guesses.get(player.player_id, [])
+            ]
+            room.players[player.player_id] = RacePlayer(
+                player.name,
+                guesses,
+                has_won=any(
+                    locations == room.num_count for _, _, locations in guesses
+                ),
+            )
+
+        newer_guesses = (
+            RaceGuess.query
+            .filter(
+                RaceGuess.room_id == record.id,
+                RaceGuess.round >= record.snapshot_round,
+            )
+            .order_by(RaceGuess.round, RaceGuess.id)
+        )
+
+        for guess in newer_guesses:
+            room._record_guess(
+                guess.player_id,
+                guess.packed_guess,
+                guess.correct_num_count,
+                guess.correct_location_count,
+            )
+
+        room.round = record.round
+
+        return room
+
+
+class RaceRoomRegistry:
+    """
+    The race rooms held in memory by this process, keyed by room id. Rooms
+    that go unused for longer than ttl_seconds are dropped.
+    """
+
+    def __init__(self, ttl_seconds=RACE_ROOM_TTL_SECONDS):
+        self._rooms = ActiveGameCache(ttl_seconds=ttl_seconds)
+        self._lock = Lock()
+
+    def create(self, answer, num_count=4, lower_bound=0, upper_bound=7):
+        """
+        Creates and saves a new race room with the given answer. Returns its
+        RaceRoom. Commits the current transaction.
+        """
+
+        record = RaceRoomRecord(
+            answer=answer,
+            num_count=num_count,
+            lower_bound=lower_bound,
+            upper_bound=upper_bound,
+        )
+        db.session.add(record)
+        db.session.commit()
+
+        room = RaceRoom(record.id, answer, num_count, lower_bound, upper_bound)
+        self._rooms.add(room.id, room)
+
+        return room
+
+    def get(self, room_id):
+        """
+        Returns the RaceRoom for room_id, or None if there's no such room.
+
+        Rebuilds it from the database if it isn't in memory, or if another
+        worker process has played a round of it or had a player join since it
+        was loaded. Guesses queued here carry over to the rebuilt room, unless
+        their round has been played.
+        """
+
+        current = db.session.execute(
+            select(
+                RaceRoomRecord.round,
+                select(func.count())
+                .where(RaceRoomPlayer.room_id == room_id)
+                .scalar_subquery(),
+            )
+            .where(RaceRoomRecord.id == room_id)
+        ).one_or_none()
+
+        if current is None:
+            self._rooms.evict(room_id)
+            return None
+
+        current_round, player_count = current
+
+        with self._lock:
+            room = self._rooms.get(room_id)
+
+            if (
+                room is None
+                or room.round < current_round
+                or len(room.players) < player_count
+            ):
+                record = db.session.get(
+                    RaceRoomRecord,
+                    room_id,
+                    populate_existing=True,
+                )
+                rebuilt_room = RaceRoom.from_record(record)
+
+                if room is not None and room.round == rebuilt_room.round:
+                    rebuilt_room.pending.update(room.pending)
+
+                room = rebuilt_room
+                self._rooms.add(room_id, room)
+
+        return room
+
+    def join(self, room, player_id, name):
+        """
+        Adds a player to room, saving them if they're new to it. Commits the
+        current transaction. Returns None.
+        """
+
+        if room.join(player_id, name):
+            db.session.execute(
+                insert(RaceRoomPlayer)
+                .values(room_id=room.id, player_id=player_id, name=name)
+                .on_conflict_do_nothing()
+            )
+            db.session.commit()
+
+    def play_round(self, room):
+        """
+        Plays the room's current round, saving all of its guesses with a
+        single bulk insert, plus a snapshot of the room every
+        SNAPSHOT_EVERY_ROUNDS rounds. Commits the current transaction.
+        Returns the number of guesses scored.
+
+        The room in memory only moves on to the next round once the round is
+        committed. If the round has already been saved (by another worker
+        process, say), nothing is saved and the room is dropped from memory,
+        so it's rebuilt from the database next time. Returns 0 in that case.
+        """
+
+        with room.round_lock:
+            rows = room.score_round()
+
+            if not rows:
+                return 0
+
+            try:
+                saved = db.session.execute(
+                    RaceRoomRecord.__table__.update()
+                    .where(RaceRoomRecord.id == room.id)
+                    .where(RaceRoomRecord.round == room.round)
+                    .values(round=room.round + 1)
+                ).rowcount
+
+                if saved:
+                    db.session.execute(insert(RaceGuess), rows)
+
+                    if (room.round + 1) % SNAPSHOT_EVERY_ROUNDS == 0:
+                        self.snapshot(room, rows)
+
+                    db.session.commit()
+            except IntegrityError:
+                saved = 0
+
+            if not saved:
+                db.session.rollback()
+                self._rooms.evict(room.id)
+                metrics.increment("race_round_conflicts")
+                return 0
+
+            room.finish_round(rows)
+
+        return len(rows)
+
+    def snapshot(self, room, round_rows=()):
+        """
+        Adds an update with a snapshot of room's state to the db session, as
+        it will be once round_rows (a round scored by RaceRoom.score_round)
+        are recorded. Returns None.
+        """
+
+        snapshot = room.to_snapshot(round_rows)
+
+        db.session.execute(
+            RaceRoomRecord.__table__.update()
+            .where(RaceRoomRecord.id == room.id)
+            .values(snapshot=snapshot, snapshot_round=snapshot["round"])
+        )
+
+    def clear(self):
+        """Drops every room from memory. Returns None."""
+
+        self._rooms.clear()
+
+
+# The rooms hosted by this process
+race_rooms = RaceRoomRegistry()
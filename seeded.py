@@ -0,0 +1,85 @@
+"""
+A deterministic, offline stand-in for the random numbers API, for load tests
+and benchmarks that need to be reproducible run to run.
+
+The answer for the nth game generated by a process depends only on the seed,
+n and the board, so replaying the same requests against a fresh process with
+the same seed produces the same games. Codes are drawn a block at a time with
+NumPy's PCG64 generator, and a block can be generated up front with
+generate_block.
+
+Set the RANDOM_NUMS_SEED environment variable to use it instead of the API.
+"""
+
+from itertools import count
+from threading import Lock
+
+import numpy as np
+
+from codes import unpack_code
+from lru import LRUCache, MISSING
+
+SEEDED_BLOCK_SIZE = 4096
+
+# Blocks of codes kept around, keyed by (num_count, lower_bound, upper_bound,
+# block_index)
+SEEDED_BLOCK_CACHE_SIZE = 16
+
+
+class SeededRandomNums:
+    """
+    Generates answers from seed and a game sequence number that counts up
+    from 0 with every answer handed out. Can be called in place of
+    MastermindGame._fetch_random_nums.
+    """
+
+    def __init__(self, seed, block_size=SEEDED_BLOCK_SIZE):
+        self.seed = seed
+        self.block_size = block_size
+        self._blocks = LRUCache(maxsize=SEEDED_BLOCK_CACHE_SIZE)
+        self._sequence = count()
+        self._lock = Lock()
+
+    def __call__(self, num_count=4, lower_bound=0, upper_bound=7):
+        """
+        Returns the answer for the next game in the sequence, as a list of
+        integers like [1, 2, 3, 4].
+        """
+
+        with self._lock:
+            sequence_number = next(self._sequence)
+
+        return self.answer_for(sequence_number, num_count, lower_bound, upper_bound)
+
+    def answer_for(self, sequence_number, num_count=4, lower_bound=0, upper_bound=7):
+        """Returns the answer for game number sequence_number, as a list of integers."""
+
+        block_index, offset = divmod(sequence_number, self.block_size)
+        key = (num_count, lower_bound, upper_bound, block_index)
+        block = self._blocks.get(key)
+
+        if block is MISSING:
+            block = self.generate_block(block_index, num_count, lower_bound, upper_bound)
+            self._blocks.put(key, block)
+
+        return unpack_code(int(block[offset]), num_count, lower_bound, upper_bound)
+
+    def generate_block(self, block_index, num_count=4, lower_bound=0, upper_bound=7):
+        """
+        Returns a NumPy array of the packed answers for games number
+        block_index * block_size up to (but not including)
+        (block_index + 1) * block_size.
+        """
+
+        base = upper_bound - lower_bound + 1
+        rng = np.random.default_rng(
+            (self.seed, num_count, base, block_index)
+        )
+
+        return rng.integers(base ** num_count, size=self.block_size, dtype=np.int64)
+
+    def reset(self):
+        """Starts the game sequence over from 0. Returns None."""
+
+        with self._lock:
+            self._sequence = count()
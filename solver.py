@@ -0,0 +1,310 @@
+"""
+Strategies for solving Mastermind, and a simulator for benchmarking them.
+
+The simulator plays every possible secret (or a random sample of them) to
+completion with a given strategy, spread across a pool of worker processes,
+and reports how many guesses it took. Scoring uses the vectorized kernel in
+codes.py, so it doubles as a stress test for it.
+
+This is available as a Flask CLI command:
+
+    flask solver simulate --strategy knuth --num-count 4 --games 500 --workers 4
+"""
+
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import click
+import numpy as np
+from flask.cli import AppGroup
+
+from codes import all_codes, score_codes, score_code_matrix
+
+# Strategies that search for their best guess only consider up to this many
+# of the remaining candidates (evenly spaced), to keep each move affordable
+GUESS_POOL_LIMIT = 256
+
+# Guesses are scored against candidates a block at a time, with blocks of at
+# most this many (guess, candidate) pairs
+SCORE_BLOCK_SIZE = 1 << 20
+
+# How many codes this process has scored, for reporting the kernel's speed
+_kernel_counts = Counter()
+
+
+def _feedback_keys(candidates, guess, num_count, lower_bound, upper_bound):
+    """
+    Scores guess against every candidate, returning an array with one key
+    per candidate for its (correct_nums, correct_locations) feedback.
+    """
+
+    _kernel_counts["codes_scored"] += len(candidates)
+    nums, locations = score_codes(
+        candidates,
+        guess,
+        num_count,
+        lower_bound,
+        upper_bound,
+    )
+
+    return nums * (num_count + 1) + locations
+
+
+def _best_guess(candidates, num_count, lower_bound, upper_bound, rate_partition):
+    """
+    Returns whichever candidate from the guess pool gets the highest rating
+    from rate_partition, which takes an array of partition sizes (how many
+    candidates would give each possible feedback).
+    """
+
+    if len(candidates) <= 2:
+        return int(candidates[0])
+
+    pool = candidates
+    if len(pool) > GUESS_POOL_LIMIT:
+        pool = candidates[
+            np.linspace(0, len(candidates) - 1, GUESS_POOL_LIMIT).astype(np.int64)
+        ]
+
+    # Score as many guesses at a time as fit in a block
+    block_guesses = max(1, SCORE_BLOCK_SIZE // len(candidates))
+    ratings = []
+
+    for start in range(0, len(pool), block_guesses):
+        block = pool[start:start + block_guesses]
+        _kernel_counts["codes_scored"] += len(block) * len(candidates)
+
+        nums, locations = score_code_matrix(
+            block,
+            candidates,
+            num_count,
+            lower_bound,
+            upper_bound,
+        )
+        feedback_keys = nums * (num_count + 1) + locations
+
+        ratings.extend(
+            rate_partition(np.bincount(keys)) for keys in feedback_keys
+        )
+
+    return int(pool[int(np.argmax(ratings))])
+
+
+def _knuth_rating(partition_sizes):
+    """Knuth's minimax: the smaller the worst case, the better."""
+
+    return -partition_sizes.max()
+
+
+def _entropy_rating(partition_sizes):
+    """The more evenly the candidates are split up, the better."""
+
+    probabilities = partition_sizes[partition_sizes > 0] / partition_sizes.sum()
+    return float((probabilities * np.log2(1 / probabilities)).sum())
+
+
+def knuth_strategy(candidates, num_count, lower_bound, upper_bound, rng):
+    """Guesses whichever candidate leaves the fewest candidates in the worst case."""
+
+    return _best_guess(candidates, num_count, lower_bound, upper_bound, _knuth_rating)
+
+
+def entropy_strategy(candidates, num_count, lower_bound, upper_bound, rng):
+    """Guesses whichever candidate's feedback is expected to tell us the most."""
+
+    return _best_guess(candidates, num_count, lower_bound, upper_bound, _entropy_rating)
+
+
+def random_strategy(candidates, num_count, lower_bound, upper_bound, rng):
+    """Guesses any candidate that's still consistent with the feedback so far."""
+
+    return int(candidates[rng.integers(len(candidates))])
+
+
+STRATEGIES = {
+    "knuth": knuth_strategy,
+    "entropy": entropy_strategy,
+    "random": random_strategy,
+}
+
+
+@lru_cache(maxsize=None)
+def _first_guess(strategy_name, num_count, lower_bound, upper_bound):
+    """
+    The first guess is the same in every game for the searching strategies,
+    so each worker only works it out once.
+    """
+
+    return STRATEGIES[strategy_name](
+        all_codes(num_count, lower_bound, upper_bound),
+        num_count,
+        lower_bound,
+        upper_bound,
+        None,
+    )
+
+
+def play_game(strategy_name, secret, num_count=4, lower_bound=0, upper_bound=7, seed=0):
+    """
+    Plays a game against the packed secret with the named strategy until
+    it's solved. Returns the number of guesses it took.
+    """
+
+    strategy = STRATEGIES[strategy_name]
+    rng = np.random.default_rng((seed, secret))
+    candidates = all_codes(num_count, lower_bound, upper_bound)
+    secret_as_array = np.array([secret], dtype=np.uint32)
+    winning_feedback = num_count * (num_count + 1) + num_count
+    guesses = 0
+
+    while True:
+        if guesses == 0 and strategy_name != "random":
+            guess = _first_guess(strategy_name, num_count, lower_bound, upper_bound)
+        else:
+            guess = strategy(candidates, num_count, lower_bound, upper_bound, rng)
+
+        guesses += 1
+        feedback = _feedback_keys(
+            secret_as_array,
+            guess,
+            num_count,
+            lower_bound,
+            upper_bound,
+        )[0]
+
+        if feedback == winning_feedback:
+            return guesses
+
+        candidates = candidates[
+            _feedback_keys(candidates, guess, num_count, lower_bound, upper_bound)
+            == feedback
+        ]
+
+
+def _play_games(args):
+    """
+    Plays a chunk of games in a worker process. Returns a list of how many
+    guesses each game took, and how many codes were scored in total.
+    """
+
+    strategy_name, secrets, num_count, lower_bound, upper_bound, seed = args
+    codes_scored_before = _kernel_counts["codes_scored"]
+
+    guess_counts = [
+        play_game(strategy_name, secret, num_count, lower_bound, upper_bound, seed)
+        for secret in secrets
+    ]
+
+    return guess_counts, _kernel_counts["codes_scored"] - codes_scored_before
+
+
+def simulate(
+    strategy_name,
+    num_count=4,
+    lower_bound=0,
+    upper_bound=7,
+    games=0,
+    workers=1,
+    seed=0,
+):
+    """
+    Plays games secrets with the named strategy (every possible secret, if
+    games is 0) across a pool of worker processes.
+
+    Returns a dictionary of results, like:
+
+    {
+        "games": 4096,
+        "average_guesses": 5.1,
+        "max_guesses": 7,
+        "distribution": {1: 1, 2: 12, ...},
+        "codes_per_second": 1234567.8,
+        "seconds": 12.3,
+    }
+    """
+
+    if strategy_name not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy_name}")
+
+    secrets = all_codes(num_count, lower_bound, upper_bound)
+    if games:
+        rng = np.random.default_rng(seed)
+        secrets = rng.choice(secrets, size=min(games, len(secrets)), replace=False)
+
+    # Split the secrets into a few chunks per worker to balance the load
+    chunks = [
+        (strategy_name, chunk.tolist(), num_count, lower_bound, upper_bound, seed)
+        for chunk in np.array_split(secrets, max(1, workers * 4))
+        if len(chunk)
+    ]
+
+    start = time.perf_counter()
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_play_games, chunks))
+    else:
+        results = [_play_games(chunk) for chunk in chunks]
+
+    seconds = time.perf_counter() - start
+
+    guess_counts = [count for counts, _ in results for count in counts]
+    codes_scored = sum(scored for _, scored in results)
+
+    return {
+        "games": len(guess_counts),
+        "average_guesses": sum(guess_counts) / len(guess_counts),
+        "max_guesses": max(guess_counts),
+        "distribution": dict(sorted(Counter(guess_counts).items())),
+        "codes_per_second": codes_scored / seconds if seconds else 0.0,
+        "seconds": seconds,
+    }
+
+
+solver_cli = AppGroup("solver", help="Benchmark Mastermind solving strategies.")
+
+
+@solver_cli.command("simulate")
+@click.option(
+    "--strategy",
+    type=click.Choice(list(STRATEGIES)),
+    default="knuth",
+    show_default=True,
+)
+@click.option("--num-count", default=4, show_default=True)
+@click.option("--lower-bound", default=0, show_default=True)
+@click.option("--upper-bound", default=7, show_default=True)
+@click.option(
+    "--games",
+    default=0,
+    show_default=True,
+    help="How many secrets to sample. 0 plays every possible secret.",
+)
+@click.option("--workers", default=1, show_default=True)
+@click.option("--seed", default=0, show_default=True)
+def simulate_command(strategy, num_count, lower_bound, upper_bound, games, workers, seed):
+    """Play many games with a strategy and report how it did."""
+
+    results = simulate(
+        strategy,
+        num_count,
+        lower_bound,
+        upper_bound,
+        games,
+        workers,
+        seed,
+    )
+
+    click.echo(f"Strategy: {strategy}, num_count: {num_count}")
+    click.echo(f"Games played: {results['games']}")
+    click.echo(f"Average guesses: {results['average_guesses']:.3f}")
+    click.echo(f"Max guesses: {results['max_guesses']}")
+    click.echo("Distribution:")
+    for guesses, count in results["distribution"].items():
+        click.echo(f"  {guesses}: {count}")
+    click.echo(
+        f"Scored {results['codes_per_second']:,.0f} codes/second "
+        f"over {results['seconds']:.2f} seconds"
+    )
@@ -0,0 +1,122 @@
+from sqlalchemy.dialects.postgresql import insert
+
+from db import db
+
+
+class GameResultCount(db.Model):
+    """
+    How many games with a particular num_count ended with a particular result
+    (won or lost) after a particular number of guesses.
+
+    Rows are incremented as each game ends, so the stats page can be built
+    from this small table instead of scanning every game and guess.
+    """
+
+    __tablename__ = 'game_result_counts'
+
+    num_count = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    has_won = db.Column(
+        db.Boolean,
+        primary_key=True,
+    )
+
+    guess_count = db.Column(
+        db.Integer,
+        primary_key=True,
+    )
+
+    games = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0,
+    )
+
+    def __repr__(self):
+        return (
+            f"<GameResultCount num_count={self.num_count}, "
+            f"has_won={self.has_won}, guess_count={self.guess_count}: {self.games}>"
+        )
+
+    @classmethod
+    def record_result(cls, num_count, has_won, guess_count):
+        """
+        Counts one more finished game with the given num_count, result and
+        guess_count. Runs as part of the current transaction, so the count is
+        only kept if the game's final guess is too. Returns None.
+        """
+
+        statement = insert(cls).values(
+            num_count=num_count,
+            has_won=has_won,
+            guess_count=guess_count,
+            games=1,
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[cls.num_count, cls.has_won, cls.guess_count],
+            set_={"games": cls.games + 1},
+        )
+
+        db.session.execute(statement)
+
+    @classmethod
+    def summarize(cls):
+        """
+        Returns a list of stats for each num_count that has finished games,
+        sorted by num_count, like:
+
+        [
+            {
+                "num_count": 4,
+                "games_played": 10,
+                "games_won": 6,
+                "win_rate": 0.6,
+                "average_guesses_to_win": 5.5,
+                "wins_by_guess_count": {4: 2, 5: 1, 6: 3},
+            },
+            ...
+        ]
+        """
+
+        return summarize_results(
+            cls.query.order_by(cls.num_count, cls.guess_count)
+        )
+
+
+def summarize_results(rows):
+    """
+    Takes in rows with num_count, has_won, guess_count and games attributes,
+    sorted by num_count then guess_count, and returns a list of stats for each
+    num_count as described in GameResultCount.summarize.
+    """
+
+    summaries = {}
+
+    for row in rows:
+        summary = summaries.setdefault(row.num_count, {
+            "num_count": row.num_count,
+            "games_played": 0,
+            "games_won": 0,
+            "total_guesses_to_win": 0,
+            "wins_by_guess_count": {},
+        })
+
+        summary["games_played"] += row.games
+
+        if row.has_won:
+            summary["games_won"] += row.games
+            summary["total_guesses_to_win"] += row.guess_count * row.games
+            summary["wins_by_guess_count"][row.guess_count] = row.games
+
+    for summary in summaries.values():
+        total_guesses_to_win = summary.pop("total_guesses_to_win")
+        summary["win_rate"] = summary["games_won"] / summary["games_played"]
+        summary["average_guesses_to_win"] = (
+            total_guesses_to_win / summary["games_won"]
+            if summary["games_won"] else None
+        )
+
+    return list(summaries.values())
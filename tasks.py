@@ -0,0 +1,195 @@
+"""
+A lightweight in-process queue for side work that doesn't need to hold up a
+response, like guess analytics and flushing daily challenge results. Tasks
+run on a small pool of worker threads, each in its own app context (and so
+its own db session). They're best effort, so anything that has to be kept
+(like the stats) belongs in the request's own transaction instead.
+
+The queue is bounded. When it's full, the caller runs the task itself
+instead, which slows down whoever is producing work faster than it can be
+done without losing any of it. A task that raises is retried a few times,
+with backoff, before it's given up on.
+
+Work that should only happen once a transaction is committed can be queued
+with submit_after_commit. It's dropped if the transaction rolls back. Quick,
+in-memory work (like updating a cache) that has to be done before the request
+carries on can be run as soon as the commit finishes with run_after_commit.
+"""
+
+import logging
+import time
+from contextlib import nullcontext
+from queue import Full, Queue
+from threading import Lock, Thread
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from db import db
+from metrics import metrics
+
+BACKGROUND_WORKERS = 2
+MAX_PENDING_TASKS = 1000
+MAX_TASK_ATTEMPTS = 3
+TASK_RETRY_DELAY_SECONDS = 0.1
+
+# Where tasks and callbacks waiting on a commit are kept in a session's info
+# dictionary
+AFTER_COMMIT_TASKS_KEY = "after_commit_tasks"
+AFTER_COMMIT_CALLBACKS_KEY = "after_commit_callbacks"
+
+logger = logging.getLogger(__name__)
+
+
+class TaskQueue:
+    """
+    A bounded queue of tasks, each a function and its arguments, run by a
+    pool of worker threads that are started when the first task comes in.
+    """
+
+    def __init__(
+        self,
+        workers=BACKGROUND_WORKERS,
+        max_pending=MAX_PENDING_TASKS,
+        max_attempts=MAX_TASK_ATTEMPTS,
+        retry_delay_seconds=TASK_RETRY_DELAY_SECONDS,
+    ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay_seconds = retry_delay_seconds
+        self.app = None
+
+        self._queue = Queue(maxsize=max_pending)
+        self._started = False
+        self._start_lock = Lock()
+
+    def init_app(self, app):
+        """Runs every task inside an app context for app. Returns None."""
+
+        self.app = app
+
+    def submit(self, func, *args):
+        """
+        Queues func(*args) to be run by a worker. If the queue is full, runs
+        it straight away instead.
+
+        Returns True if the task was queued, or False if it was run here.
+        """
+
+        self._start()
+
+        try:
+            self._queue.put_nowait((func, args))
+        except Full:
+            metrics.increment("background_tasks_run_inline")
+            self._run(func, args)
+            return False
+
+        return True
+
+    def join(self):
+        """Waits until every queued task has been run. Returns None."""
+
+        self._queue.join()
+
+    def _start(self):
+        """Starts the worker threads, if they aren't running."""
+
+        with self._start_lock:
+            if self._started:
+                return
+
+            for i in range(self.workers):
+                Thread(
+                    target=self._work,
+                    name=f"background-task-{i}",
+                    daemon=True,
+                ).start()
+
+            self._started = True
+
+    def _work(self):
+        """Runs queued tasks, one at a time, forever."""
+
+        while True:
+            func, args = self._queue.get()
+
+            try:
+                self._run(func, args)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, func, args):
+        """
+        Runs func(*args), retrying with exponential backoff if it raises, up
+        to max_attempts times in all. Gives up (logging the error) after
+        that. Returns None.
+        """
+
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                with self._app_context():
+                    func(*args)
+                return
+            except Exception:
+                if attempt == self.max_attempts:
+                    metrics.increment("background_tasks_failed")
+                    logger.exception("Background task %r failed", func)
+                    return
+
+                metrics.increment("background_tasks_retried")
+                time.sleep(self.retry_delay_seconds * 2 ** (attempt - 1))
+
+    def _app_context(self):
+        """Returns a new app context for running a task in."""
+
+        if self.app is None:
+            return nullcontext()
+
+        return self.app.app_context()
+
+
+def submit_after_commit(func, *args):
+    """
+    Queues func(*args) to be run in the background once db.session's current
+    transaction commits. If it's rolled back instead, the task is dropped.
+    Returns None.
+    """
+
+    db.session.info.setdefault(AFTER_COMMIT_TASKS_KEY, []).append((func, args))
+
+
+def run_after_commit(func, *args):
+    """
+    Calls func(*args) in this thread as soon as db.session's current
+    transaction commits. If it's rolled back instead, the call is dropped.
+    func can't use the session, so this is only for in-memory work. Returns
+    None.
+    """
+
+    db.session.info.setdefault(AFTER_COMMIT_CALLBACKS_KEY, []).append(
+        (func, args)
+    )
+
+
+@event.listens_for(Session, "after_commit")
+def _submit_after_commit_tasks(session):
+    for func, args in session.info.pop(AFTER_COMMIT_CALLBACKS_KEY, []):
+        func(*args)
+
+    for func, args in session.info.pop(AFTER_COMMIT_TASKS_KEY, []):
+        background_tasks.submit(func, *args)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_after_commit_tasks(session, previous_transaction):
+    # Rolling back a savepoint leaves the transaction around it to commit
+    if previous_transaction.nested:
+        return
+
+    session.info.pop(AFTER_COMMIT_CALLBACKS_KEY, None)
+    session.info.pop(AFTER_COMMIT_TASKS_KEY, None)
+
+
+# Shared by every request handled by this process
+background_tasks = TaskQueue()
@@ -0,0 +1,79 @@
+from unittest import TestCase
+
+import numpy as np
+
+from analytics import analyze_guess, candidate_dtype, is_tracked, replay_candidates
+from codes import all_codes, pack_code
+from game_state import GuessRecord
+
+
+class AnalyticsTestCase(TestCase):
+    """Test guess analytics."""
+
+    def test_analyze_first_guess(self):
+        """Test the candidate counts and entropy for an opening guess."""
+
+        analysis = analyze_guess(all_codes(), pack_code([0, 0, 0, 0]), 0, 0)
+
+        # Every code without a 0 in it is still possible
+        self.assertEqual(analysis.candidates_before, 8 ** 4)
+        self.assertEqual(analysis.candidates_after, 7 ** 4)
+        self.assertEqual(len(analysis.candidates), 7 ** 4)
+        self.assertGreater(analysis.feedback_entropy, 0)
+
+    def test_candidates_kept_compact(self):
+        """
+        Test that candidates are kept as uint16 on boards where every code
+        fits, with or without a partition table.
+        """
+
+        for num_count in (4, 5):
+            analysis = analyze_guess(
+                all_codes(num_count),
+                pack_code([0] * num_count),
+                0,
+                0,
+                num_count,
+            )
+
+            self.assertEqual(analysis.candidates.dtype, np.uint16)
+            self.assertEqual(analysis.candidates_after, 7 ** num_count)
+
+        self.assertEqual(candidate_dtype(6), np.uint32)
+
+    def test_winning_guess_leaves_one_candidate(self):
+        """Test that a single remaining candidate has no entropy left."""
+
+        candidates = all_codes()[[668]]
+        analysis = analyze_guess(candidates, 668, 4, 4)
+
+        self.assertEqual(analysis.candidates_after, 1)
+        self.assertEqual(analysis.feedback_entropy, 0)
+
+    def test_replay_matches_incremental(self):
+        """Test that replaying a history narrows candidates the same way."""
+
+        history = [
+            GuessRecord([0, 0, 1, 1], 1, 0),
+            GuessRecord([2, 2, 3, 3], 2, 1),
+        ]
+
+        candidates = all_codes()
+        for guess in history:
+            candidates = analyze_guess(
+                candidates,
+                pack_code(guess.numbers_guessed),
+                guess.correct_num_count,
+                guess.correct_location_count,
+            ).candidates
+
+        self.assertEqual(
+            replay_candidates(history).tolist(),
+            candidates.tolist()
+        )
+
+    def test_is_tracked(self):
+        """Test that analytics are skipped for the biggest boards."""
+
+        self.assertTrue(is_tracked(num_count=6))
+        self.assertFalse(is_tracked(num_count=8))
@@ -1,9 +1,14 @@
+import asyncio
 import os
+import tempfile
 from dotenv import load_dotenv
 
 from unittest import TestCase
 from unittest.mock import patch
 
+from flask import g
+from sqlalchemy.orm.exc import StaleDataError
+
 import mastermind
 
 load_dotenv()
@@ -11,7 +16,12 @@ load_dotenv()
 # This line must run before we import the app
 os.environ['DATABASE_URL'] = os.environ["TEST_DATABASE_URL"]
 
+import archive
 from app import app, CURR_GAME_KEY
+from fetcher import random_fetcher
+from metrics import metrics
+from stats import GameResultCount
+from tasks import background_tasks
 
 
 app.config['TESTING'] = True
@@ -29,6 +39,7 @@ class MastermindAppTestCase(TestCase):
 
         mastermind.Guess.query.delete()
         mastermind.MastermindGame.query.delete()
+        GameResultCount.query.delete()
 
         # Mock requests.get() return value to predict our random numbers and
         # avoid calling the real API
@@ -47,6 +58,13 @@ class MastermindAppTestCase(TestCase):
             with client.session_transaction() as session:
                 session.clear()
 
+        # Let any background work from this test finish before the next one
+        background_tasks.join()
+
+        # Requests share the app context pushed by connect_db, so don't let
+        # this test's current game carry over into the next one
+        g.pop(CURR_GAME_KEY, None)
+
         # Clean up any fouled transactions, should they occur
         mastermind.db.session.rollback()
 
@@ -62,15 +80,14 @@ class MastermindAppTestCase(TestCase):
                 html
             )
 
-    @patch.object(mastermind.requests, "get")
+    @patch.object(random_fetcher, "fetch_async")
     def test_start_new_game(self, mock_fetch):
         """
         Test that we can start a new game and get redirected to play
         successfully.
         """
-        # Note: we're mocking requests.get() again here to avoid calling the
-        # real API.
-        mock_fetch.return_value.text = "1\n2\n3\n4\n"
+        # Note: we're mocking the fetcher here to avoid calling the real API.
+        mock_fetch.return_value = [1, 2, 3, 4]
 
         with app.test_client() as client:
             response = client.post(
@@ -86,6 +103,56 @@ class MastermindAppTestCase(TestCase):
             self.assertIn("New game started!", html)
             self.assertIn("You have 10 guesses left.", html)
 
+    @patch("app.NEW_GAME_FETCH_TIMEOUT_SECONDS", 0.01)
+    @patch.object(random_fetcher, "fetch_async")
+    def test_start_new_game_timeout(self, mock_fetch):
+        """
+        Test that starting a new game gives up, rather than hanging, if the
+        random numbers take too long to come back.
+        """
+
+        async def slow_fetch(num_count):
+            await asyncio.sleep(1)
+
+        mock_fetch.side_effect = slow_fetch
+
+        with app.test_client() as client:
+            response = client.post(
+                '/new-game',
+                data={
+                    "num-count": "4"
+                },
+                follow_redirects=True
+            )
+            html = response.get_data(as_text=True)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("couldn&#39;t start a new game", html)
+            self.assertEqual(mastermind.MastermindGame.query.count(), 1)
+
+    @patch.object(mastermind.requests, "get")
+    def test_start_daily_game(self, mock_fetch):
+        """
+        Test that we can start today's daily challenge and get redirected to
+        play successfully.
+        """
+
+        mock_fetch.return_value.text = "1\n2\n3\n4\n"
+
+        with app.test_client() as client:
+            response = client.post(
+                '/new-daily-game',
+                data={
+                    "num-count": "4"
+                },
+                follow_redirects=True
+            )
+            html = response.get_data(as_text=True)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("Daily challenge started!", html)
+            self.assertIn("You have 10 guesses left.", html)
+
     def test_make_valid_guess(self):
         """
         Test that we can submit a valid guess for a new game instance and
@@ -99,6 +166,7 @@ class MastermindAppTestCase(TestCase):
             response = client.post(
                 '/submit-guess',
                 data={
+                    "version": "0",
                     "num-0": "4",
                     "num-1": "4",
                     "num-2": "4",
@@ -112,6 +180,285 @@ class MastermindAppTestCase(TestCase):
             self.assertIn("You have 9 guesses left.", html)
             self.assertIn("1 correct number(s) and 1 correct location(s)", html)
 
+    def test_duplicate_guess_ignored(self):
+        """
+        Test that resubmitting a guess with the same idempotency key doesn't
+        count as a second guess.
+        """
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            duplicates_before = metrics.get("duplicate_guesses")
+
+            for i in range(2):
+                response = client.post(
+                    '/submit-guess',
+                    data={
+                        "version": "0",
+                        "idempotency-key": "double-click",
+                        "num-0": "4",
+                        "num-1": "4",
+                        "num-2": "4",
+                        "num-3": "4",
+                    },
+                    follow_redirects=True
+                )
+            html = response.get_data(as_text=True)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("You have 9 guesses left.", html)
+            self.assertEqual(
+                metrics.get("duplicate_guesses"),
+                duplicates_before + 1
+            )
+
+    def test_stale_version_guess_ignored(self):
+        """
+        Test that a guess made against an earlier version of the game isn't
+        counted, even with a new idempotency key (as when a retry reaches
+        another worker process).
+        """
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            for key in ("first-try", "retry"):
+                response = client.post(
+                    '/submit-guess/fragment',
+                    data={
+                        "version": "0",
+                        "idempotency-key": key,
+                        "num-0": "4",
+                        "num-1": "4",
+                        "num-2": "4",
+                        "num-3": "4",
+                    },
+                )
+
+            self.assertEqual(response.status_code, 409)
+
+            response = client.get('/play')
+            self.assertIn("You have 9 guesses left.", response.get_data(as_text=True))
+
+    def test_stale_version_guess_flashes(self):
+        """
+        Test that a full page guess made against an earlier version of the
+        game tells the player to try again.
+        """
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            response = client.post(
+                '/submit-guess',
+                data={
+                    "version": "3",
+                    "num-0": "4",
+                    "num-1": "4",
+                    "num-2": "4",
+                    "num-3": "4",
+                },
+                follow_redirects=True
+            )
+            html = response.get_data(as_text=True)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("Please try again.", html)
+            self.assertIn("You have 10 guesses left.", html)
+
+    def test_guess_without_version(self):
+        """Test that a guess made without a version is made as usual."""
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            response = client.post(
+                '/submit-guess',
+                data={"guess": "4444"},
+                follow_redirects=True
+            )
+
+            self.assertIn(
+                "You have 9 guesses left.",
+                response.get_data(as_text=True)
+            )
+
+    def test_make_valid_guess_fragment(self):
+        """
+        Test that submitting a guess to the fragment route responds with only
+        the new history row and remaining guesses header.
+        """
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            response = client.post(
+                '/submit-guess/fragment',
+                data={
+                    "version": "0",
+                    "num-0": "4",
+                    "num-1": "4",
+                    "num-2": "4",
+                    "num-3": "4",
+                },
+            )
+            html = response.get_data(as_text=True)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("You have 9 guesses left.", html)
+            self.assertIn(
+                "1: [4, 4, 4, 4] -- 1 correct number(s) and 1 correct location(s)",
+                html
+            )
+            self.assertNotIn("<form", html)
+
+    def test_duplicate_guess_fragment(self):
+        """
+        Test that resubmitting a guess to the fragment route with the same
+        idempotency key responds with no content, so no row is added twice.
+        """
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            responses = [
+                client.post(
+                    '/submit-guess/fragment',
+                    data={
+                        "version": "0",
+                        "idempotency-key": "double-click",
+                        "num-0": "4",
+                        "num-1": "4",
+                        "num-2": "4",
+                        "num-3": "4",
+                    },
+                )
+                for i in range(2)
+            ]
+
+            self.assertEqual(responses[0].status_code, 200)
+            self.assertEqual(responses[1].status_code, 204)
+            self.assertEqual(responses[1].get_data(as_text=True), "")
+
+    @patch.object(mastermind.MastermindGame, "handle_guess")
+    def test_conflicting_guess_fragment(self, mock_handle_guess):
+        """
+        Test that a guess rejected because another was made first gets a
+        conflict response from the fragment route.
+        """
+
+        mock_handle_guess.side_effect = StaleDataError()
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            response = client.post(
+                '/submit-guess/fragment',
+                data={
+                    "version": "0",
+                    "num-0": "4",
+                    "num-1": "4",
+                    "num-2": "4",
+                    "num-3": "4",
+                },
+            )
+
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(response.get_data(as_text=True), "")
+
+    def test_win_from_guess_fragment(self):
+        """
+        Test that a winning guess submitted to the fragment route redirects to
+        the win page.
+        """
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            response = client.post(
+                '/submit-guess/fragment',
+                data={
+                    "version": "0",
+                    "num-0": "1",
+                    "num-1": "2",
+                    "num-2": "3",
+                    "num-3": "4",
+                },
+            )
+
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(response.location, "/win")
+
+    def test_play_not_modified(self):
+        """
+        Test that revalidating an unchanged gameplay page gets a 304, and that
+        making a guess changes its ETag.
+        """
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            response = client.get('/play')
+            etag = response.headers["ETag"]
+            self.assertEqual(response.status_code, 200)
+
+            response = client.get('/play', headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.get_data(as_text=True), "")
+
+            client.post(
+                '/submit-guess',
+                data={
+                    "version": "0",
+                    "num-0": "4",
+                    "num-1": "4",
+                    "num-2": "4",
+                    "num-3": "4",
+                },
+            )
+
+            response = client.get('/play', headers={"If-None-Match": etag})
+            html = response.get_data(as_text=True)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response.headers["ETag"], etag)
+            self.assertIn("You have 9 guesses left.", html)
+
+    def test_archived_game_forgotten(self):
+        """
+        Test that a player whose game has been archived and deleted can carry
+        on, without a current game.
+        """
+
+        game = mastermind.db.session.get(mastermind.MastermindGame, self.test_game_id)
+        game.handle_guess([1, 2, 3, 4])
+        mastermind.db.session.commit()
+
+        with tempfile.NamedTemporaryFile(suffix=".jsonl.gz") as archive_file:
+            archive.export_games(archive_file.name)
+            archive.delete_archived_games(archive_file.name, pause_seconds=0)
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            response = client.get('/')
+
+            self.assertEqual(response.status_code, 200)
+
+            with client.session_transaction() as change_session:
+                self.assertNotIn(CURR_GAME_KEY, change_session)
+
     def test_redirect_play_from_win(self):
         """
         Test that we get redirected back to the play page if we try to access
@@ -174,6 +521,7 @@ class MastermindAppTestCase(TestCase):
             client.post(
                 '/submit-guess',
                 data={
+                    "version": "0",
                     "num-0": "1",
                     "num-1": "2",
                     "num-2": "3",
@@ -204,6 +552,7 @@ class MastermindAppTestCase(TestCase):
                 client.post(
                     '/submit-guess',
                     data={
+                        "version": str(i),
                         "num-0": "1",
                         "num-1": "1",
                         "num-2": "1",
@@ -233,6 +582,7 @@ class MastermindAppTestCase(TestCase):
             response = client.post(
                 '/submit-guess',
                 data={
+                    "version": "0",
                     "num-0": "not",
                     "num-1": "good",
                     "num-2": "data",
@@ -262,6 +612,7 @@ class MastermindAppTestCase(TestCase):
             response = client.post(
                 '/submit-guess',
                 data={
+                    "version": "0",
                     "num-0": "8",
                     "num-1": "8",
                     "num-2": "8",
@@ -278,6 +629,36 @@ class MastermindAppTestCase(TestCase):
                 html
             )
 
+    def test_make_packed_guess(self):
+        """
+        Test that a guess can be submitted with all of its numbers in one
+        field, and that every invalid number in it is pointed out.
+        """
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            response = client.post(
+                '/submit-guess',
+                data={"version": "0", "guess": "0818"},
+                follow_redirects=True
+            )
+            html = response.get_data(as_text=True)
+
+            self.assertIn("You have 10 guesses left.", html)
+            self.assertIn("Check number(s) 2, 4.", html)
+
+            response = client.post(
+                '/submit-guess',
+                data={"version": "0", "guess": "0123"},
+                follow_redirects=True
+            )
+            html = response.get_data(as_text=True)
+
+            self.assertIn("You have 9 guesses left.", html)
+            self.assertIn("[0, 1, 2, 3]", html)
+
     def test_win_on_correct_guess(self):
         """
         Test that we can submit the correct guess and get redirected to the
@@ -292,6 +673,7 @@ class MastermindAppTestCase(TestCase):
             response = client.post(
                 '/submit-guess',
                 data={
+                    "version": "0",
                     "num-0": "1",
                     "num-1": "2",
                     "num-2": "3",
@@ -304,6 +686,84 @@ class MastermindAppTestCase(TestCase):
             self.assertEqual(response.status_code, 200)
             self.assertIn("You won with 9 guesses remaining!", html)
 
+    def test_display_history(self):
+        """Test that the guess history page shows the latest guesses."""
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            client.post(
+                '/submit-guess',
+                data={
+                    "version": "0",
+                    "num-0": "0",
+                    "num-1": "0",
+                    "num-2": "0",
+                    "num-3": "0",
+                },
+            )
+
+            response = client.get('/history')
+            html = response.get_data(as_text=True)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("1: [0, 0, 0, 0] -- All incorrect.", html)
+            self.assertNotIn("Older guesses", html)
+
+            response = client.get('/history?before=nonsense')
+            self.assertEqual(response.status_code, 400)
+
+    def test_metrics_score_cache_hit_rate(self):
+        """Test that the metrics include the score cache's hit rate."""
+
+        metrics.reset()
+        mastermind.score_cache.clear()
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            for version, guess in enumerate(("0", "0", "5")):
+                client.post(
+                    '/submit-guess',
+                    data={
+                        "version": str(version),
+                        **{f"num-{n}": guess for n in range(4)},
+                    },
+                )
+
+            response = client.get('/metrics')
+
+            self.assertEqual(response.json["score_cache_misses"], 2)
+            self.assertEqual(response.json["score_cache_hits"], 1)
+            self.assertAlmostEqual(response.json["score_cache_hit_rate"], 1 / 3)
+
+    def test_stats_after_win(self):
+        """Test that a won game shows up on the stats page."""
+
+        with app.test_client() as client:
+            with client.session_transaction() as change_session:
+                change_session[CURR_GAME_KEY] = self.test_game_id
+
+            client.post(
+                '/submit-guess',
+                data={
+                    "version": "0",
+                    "num-0": "1",
+                    "num-1": "2",
+                    "num-2": "3",
+                    "num-3": "4",
+                },
+            )
+
+            response = client.get('/stats')
+            html = response.get_data(as_text=True)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("Win rate: 100%", html)
+            self.assertIn("Average guesses to win: 1.0", html)
+
     def test_lose(self):
         """
         Test that we can submit the correct amount of wrong guesses to get to the
@@ -319,6 +779,7 @@ class MastermindAppTestCase(TestCase):
                 client.post(
                     '/submit-guess',
                     data={
+                        "version": str(i),
                         "num-0": "1",
                         "num-1": "1",
                         "num-2": "1",
@@ -331,6 +792,7 @@ class MastermindAppTestCase(TestCase):
             response = client.post(
                 '/submit-guess',
                 data={
+                    "version": "10",
                     "num-0": "1",
                     "num-1": "1",
                     "num-2": "1",
@@ -0,0 +1,125 @@
+import os
+import tempfile
+from dotenv import load_dotenv
+
+from unittest import TestCase
+from unittest.mock import patch
+
+import archive
+import mastermind
+
+load_dotenv()
+
+# This line must run before we import the app
+os.environ['DATABASE_URL'] = os.environ["TEST_DATABASE_URL"]
+
+from app import app
+
+
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+mastermind.db.create_all()
+
+
+class ArchiveTestCase(TestCase):
+    """Test exporting, deleting and importing finished games."""
+
+    @patch.object(mastermind.requests, "get")
+    def setUp(self, mock_fetch):
+        """What to do before every test runs."""
+
+        mastermind.Guess.query.delete()
+        mastermind.MastermindGame.query.delete()
+
+        mock_fetch.return_value.text = "1\n2\n3\n4\n"
+
+        # One game that's been won, and one that's still being played
+        finished_game = mastermind.MastermindGame.generate_new_game()
+        active_game = mastermind.MastermindGame.generate_new_game()
+        mastermind.db.session.commit()
+
+        finished_game.handle_guess([0, 0, 0, 0])
+        finished_game.handle_guess([1, 2, 3, 4])
+        active_game.handle_guess([0, 0, 0, 0])
+        mastermind.db.session.commit()
+
+        self.finished_game_id = finished_game.id
+        self.active_game_id = active_game.id
+
+        archive_file = tempfile.NamedTemporaryFile(suffix=".jsonl.gz")
+        self.addCleanup(archive_file.close)
+        self.path = archive_file.name
+
+    def tearDown(self):
+        """What to do after every test runs."""
+
+        mastermind.db.session.rollback()
+
+    def test_export_and_delete(self):
+        """
+        Test that only finished games are exported, and that deleting them
+        also deletes their guesses.
+        """
+
+        self.assertEqual(archive.export_games(self.path), 1)
+        self.assertEqual(
+            archive.delete_archived_games(self.path, pause_seconds=0),
+            1
+        )
+
+        self.assertEqual(
+            [game.id for game in mastermind.MastermindGame.query],
+            [self.active_game_id]
+        )
+        self.assertEqual(mastermind.Guess.query.count(), 1)
+
+    def test_import(self):
+        """Test that archived games can be imported back for replay."""
+
+        archive.export_games(self.path, batch_size=1)
+        archive.delete_archived_games(self.path, pause_seconds=0)
+
+        self.assertEqual(archive.import_games(self.path), 1)
+
+        imported_game = mastermind.MastermindGame.query.filter(
+            mastermind.MastermindGame.id != self.active_game_id
+        ).one()
+
+        self.assertTrue(imported_game.has_won)
+        self.assertEqual(imported_game.answer, [1, 2, 3, 4])
+        self.assertEqual(
+            [guess.numbers_guessed for guess in imported_game.guess_history],
+            [[0, 0, 0, 0], [1, 2, 3, 4]]
+        )
+
+    @patch.object(mastermind.requests, "get")
+    def test_daily_game_round_trip(self, mock_fetch):
+        """
+        Test that a daily challenge game is still one after being exported
+        and imported again.
+        """
+
+        mock_fetch.return_value.text = "5\n6\n7\n0\n"
+
+        daily_game = mastermind.MastermindGame.generate_daily_game()
+        mastermind.db.session.commit()
+        daily_game.handle_guess(list(daily_game.answer))
+        mastermind.db.session.commit()
+        daily_date = daily_game.daily_challenge_date
+
+        archive.export_games(self.path)
+        archive.delete_archived_games(self.path, pause_seconds=0)
+        archive.import_games(self.path)
+
+        # Games are imported in the order they were exported, by id
+        imported_games = (
+            mastermind.MastermindGame.query
+            .filter(mastermind.MastermindGame.id != self.active_game_id)
+            .order_by(mastermind.MastermindGame.id)
+        )
+
+        self.assertEqual(
+            [game.daily_challenge_date for game in imported_games],
+            [None, daily_date]
+        )
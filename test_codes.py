@@ -0,0 +1,132 @@
+from itertools import product
+from unittest import TestCase
+
+from codes import (
+    InvalidCodeError, all_codes, pack_code, unpack_code, parse_code,
+    parse_code_fields, score_code, score_codes, score_code_matrix,
+)
+from mastermind import MastermindGame
+
+
+class PackedCodeTestCase(TestCase):
+    """Test packing and unpacking of number combinations."""
+
+    def test_round_trip(self):
+        """Test that unpacking a packed code gives back the same numbers."""
+
+        self.assertEqual(pack_code([1, 2, 3, 4]), 668)
+        self.assertEqual(unpack_code(668), [1, 2, 3, 4])
+        self.assertEqual(
+            unpack_code(pack_code([7, 0, 0, 7, 1, 2], 0, 7), 6, 0, 7),
+            [7, 0, 0, 7, 1, 2]
+        )
+
+    def test_codes_sort_like_combinations(self):
+        """Test that packed codes sort in the same order as their numbers."""
+
+        combos = [[0, 0, 0, 7], [0, 0, 1, 0], [1, 0, 0, 0], [0, 7, 7, 7]]
+        packed = [pack_code(combo) for combo in combos]
+
+        self.assertEqual(
+            [unpack_code(code) for code in sorted(packed)],
+            sorted(combos)
+        )
+
+
+class ParseCodeTestCase(TestCase):
+    """Test parsing codes from text and form fields."""
+
+    def test_parse_code(self):
+        """Test that a code written as digits is parsed and packed."""
+
+        self.assertEqual(parse_code("1234"), ([1, 2, 3, 4], 668))
+        self.assertEqual(
+            parse_code("70071234", 8),
+            ([7, 0, 0, 7, 1, 2, 3, 4], pack_code([7, 0, 0, 7, 1, 2, 3, 4])),
+        )
+
+    def test_parse_code_reports_every_invalid_slot(self):
+        """Test that every bad, missing or extra number is reported at once."""
+
+        with self.assertRaises(InvalidCodeError) as context:
+            parse_code("1x8")
+
+        self.assertEqual(context.exception.invalid_slots, [1, 2, 3])
+
+        with self.assertRaises(InvalidCodeError) as context:
+            parse_code("123456")
+
+        self.assertEqual(context.exception.invalid_slots, [4, 5])
+
+    def test_parse_code_fields(self):
+        """Test that a code spread across fields is parsed and packed."""
+
+        fields = {"a": "1", "b": " 2", "c": "3", "d": "4"}
+
+        self.assertEqual(
+            parse_code_fields(fields, ("a", "b", "c", "d")),
+            ([1, 2, 3, 4], 668),
+        )
+
+        with self.assertRaises(InvalidCodeError) as context:
+            parse_code_fields({"a": "nope", "b": "-1", "c": "3"}, ("a", "b", "c", "d"))
+
+        self.assertEqual(context.exception.invalid_slots, [0, 1, 3])
+
+
+class ScoreCodesTestCase(TestCase):
+    """Test the vectorized scoring helpers."""
+
+    def test_matches_score_guess(self):
+        """
+        Test that score_codes and score_code agree with
+        MastermindGame.score_guess for every answer on a small board.
+        """
+
+        answers = all_codes(num_count=3, lower_bound=1, upper_bound=4)
+
+        for guess in ([1, 1, 2], [4, 3, 2], [2, 2, 2]):
+            nums, locations = score_codes(
+                answers,
+                pack_code(guess, 1, 4),
+                num_count=3,
+                lower_bound=1,
+                upper_bound=4,
+            )
+
+            for i, answer in enumerate(product(range(1, 5), repeat=3)):
+                game = MastermindGame(
+                    answer=list(answer),
+                    num_count=3,
+                    lower_bound=1,
+                    upper_bound=4,
+                )
+                score = game.score_guess(guess)
+
+                self.assertEqual(
+                    (nums[i], locations[i]),
+                    (score["correct_nums"], score["correct_locations"])
+                )
+                self.assertEqual(
+                    score_code(
+                        pack_code(answer, 1, 4),
+                        pack_code(guess, 1, 4),
+                        num_count=3,
+                        lower_bound=1,
+                        upper_bound=4,
+                    ),
+                    (score["correct_nums"], score["correct_locations"])
+                )
+
+    def test_matrix_matches_score_codes(self):
+        """Test that score_code_matrix agrees with score_codes row by row."""
+
+        answers = all_codes(num_count=4)[::37]
+        guesses = all_codes(num_count=4)[::501]
+
+        nums, locations = score_code_matrix(guesses, answers)
+
+        for i, guess in enumerate(guesses):
+            row_nums, row_locations = score_codes(answers, int(guess))
+            self.assertEqual(nums[i].tolist(), row_nums.tolist())
+            self.assertEqual(locations[i].tolist(), row_locations.tolist())
@@ -0,0 +1,131 @@
+import os
+import time
+from dotenv import load_dotenv
+
+from unittest import TestCase
+from unittest.mock import patch
+
+import mastermind
+from daily import (
+    DailyChallenge, DailyChallengeResultCount, DailyResultsBuffer,
+    daily_answers, today,
+)
+from metrics import metrics
+from tasks import background_tasks
+
+load_dotenv()
+
+# This line must run before we import the app
+os.environ['DATABASE_URL'] = os.environ["TEST_DATABASE_URL"]
+
+from app import app
+
+
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+mastermind.db.create_all()
+
+
+class DailyChallengeTestCase(TestCase):
+    """Test the daily challenge."""
+
+    def setUp(self):
+        """What to do before every test runs."""
+
+        mastermind.Guess.query.delete()
+        mastermind.MastermindGame.query.delete()
+        DailyChallenge.query.delete()
+        DailyChallengeResultCount.query.delete()
+        mastermind.db.session.commit()
+
+        daily_answers.clear()
+        mastermind.score_cache.clear()
+
+    def tearDown(self):
+        """What to do after every test runs."""
+
+        mastermind.db.session.rollback()
+
+    @patch.object(mastermind.requests, "get")
+    def test_daily_games_share_answer(self, mock_fetch):
+        """
+        Test that daily games with the same num_count share an answer, which is
+        only fetched once.
+        """
+
+        mock_fetch.return_value.text = "5\n6\n7\n0\n"
+
+        first_game = mastermind.MastermindGame.generate_daily_game()
+        mock_fetch.return_value.text = "1\n1\n1\n1\n"
+        second_game = mastermind.MastermindGame.generate_daily_game()
+        mastermind.db.session.commit()
+
+        self.assertEqual(mock_fetch.call_count, 1)
+        self.assertEqual(first_game.answer, [5, 6, 7, 0])
+        self.assertEqual(second_game.answer, [5, 6, 7, 0])
+        self.assertEqual(first_game.daily_challenge_date, today())
+
+        # Other workers, with nothing cached, see the same answer
+        daily_answers.clear()
+        self.assertEqual(
+            DailyChallenge.get_answer(today(), 4, lambda num_count: None),
+            [5, 6, 7, 0]
+        )
+
+    @patch.object(mastermind.requests, "get")
+    def test_daily_scores_memoized(self, mock_fetch):
+        """Test that scores for daily challenge guesses are shared."""
+
+        mock_fetch.return_value.text = "5\n6\n7\n0\n"
+
+        first_game = mastermind.MastermindGame.generate_daily_game()
+        second_game = mastermind.MastermindGame.generate_daily_game()
+        mastermind.db.session.commit()
+
+        first_game.handle_guess([0, 6, 5, 1])
+        hits = metrics.get("score_cache_hits")
+        second_game.handle_guess([0, 6, 5, 1])
+        mastermind.db.session.commit()
+
+        self.assertEqual(metrics.get("score_cache_hits"), hits + 1)
+        self.assertEqual(
+            second_game.history[0],
+            ([0, 6, 5, 1], 3, 1),
+        )
+
+    def test_results_flushed(self):
+        """Test that buffered results are added to the database on flush."""
+
+        buffer = DailyResultsBuffer(flush_seconds=60)
+        buffer.record(today(), 4, True, 3)
+        buffer.record(today(), 4, True, 3)
+        buffer.flush_if_due()
+
+        self.assertEqual(DailyChallengeResultCount.query.count(), 0)
+
+        buffer.flush()
+        buffer.record(today(), 4, False, 10)
+        buffer.flush()
+
+        stats = DailyChallengeResultCount.summarize(today())
+        self.assertEqual(stats[0]["games_played"], 3)
+        self.assertEqual(stats[0]["wins_by_guess_count"], {3: 2})
+
+    def test_results_flushed_periodically(self):
+        """
+        Test that once started, buffered results are flushed on a timer, even
+        if no more games finish.
+        """
+
+        buffer = DailyResultsBuffer(flush_seconds=0.05)
+        buffer.record(today(), 4, True, 3)
+        buffer.start(background_tasks)
+        self.addCleanup(buffer.stop)
+
+        time.sleep(0.2)
+        background_tasks.join()
+        mastermind.db.session.expire_all()
+
+        stats = DailyChallengeResultCount.summarize(today())
+        self.assertEqual(stats[0]["games_played"], 1)
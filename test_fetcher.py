@@ -0,0 +1,138 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from unittest import TestCase
+from urllib.parse import parse_qs, urlparse
+
+import httpx
+
+from fetcher import RandomNumsFetcher
+
+# How long the stub API takes to answer each call
+STUB_LATENCY_SECONDS = 0.2
+
+
+class StubRandomNumsHandler(BaseHTTPRequestHandler):
+    """
+    Answers like the random numbers API, slowly. Hands out 0, 1, 2, ... so
+    every number can be traced back to where it was handed out.
+    """
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        num_count = int(params["num"][0])
+
+        time.sleep(STUB_LATENCY_SECONDS)
+
+        if self.server.fail:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        start = self.server.handed_out
+        self.server.handed_out += num_count
+        self.server.calls += 1
+
+        body = "".join(f"{n}\n" for n in range(start, start + num_count))
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+class RandomNumsFetcherTestCase(TestCase):
+    """Test RandomNumsFetcher against a local stub of the API."""
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubRandomNumsHandler)
+        self.server.calls = 0
+        self.server.handed_out = 0
+        self.server.fail = False
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+        host, port = self.server.server_address
+        self.fetcher = RandomNumsFetcher(base_url=f"http://{host}:{port}/")
+
+    def tearDown(self):
+        self.fetcher.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_fetch(self):
+        """Test that a single fetch returns the numbers from the API."""
+
+        self.assertEqual(self.fetcher.fetch(4).result(timeout=5), [0, 1, 2, 3])
+        self.assertEqual(self.server.calls, 1)
+
+    def test_close(self):
+        """
+        Test that closing the fetcher stops its loop thread, and that it
+        starts up again for the next fetch.
+        """
+
+        self.fetcher.fetch(4).result(timeout=5)
+        thread = self.fetcher._thread
+
+        self.fetcher.close()
+
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(self.fetcher._client)
+        self.assertEqual(self.fetcher.fetch(4).result(timeout=5), [4, 5, 6, 7])
+
+    def test_concurrent_fetches_are_coalesced(self):
+        """
+        Test that fetches made while a call is in flight share the next call,
+        and each still gets its own numbers.
+        """
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(
+                lambda _: self.fetcher.fetch(4).result(timeout=5),
+                range(20),
+            ))
+
+        self.assertTrue(all(len(nums) == 4 for nums in results))
+
+        # No number was handed to more than one fetch
+        handed_out = sorted(n for nums in results for n in nums)
+        self.assertEqual(handed_out, list(range(80)))
+
+        # The first fetch goes out alone, and the rest are batched behind it
+        self.assertLess(self.server.calls, 20)
+        self.assertEqual(self.fetcher.upstream_calls, self.server.calls)
+
+    def test_cancelled_fetch_skipped(self):
+        """
+        Test that cancelling one of a batch of fetches doesn't stop the rest
+        of the batch from getting their numbers.
+        """
+
+        first = self.fetcher.fetch(4)
+        time.sleep(STUB_LATENCY_SECONDS / 4)
+
+        # These two are batched together behind the first fetch
+        cancelled = self.fetcher.fetch(4)
+        waiting = self.fetcher.fetch(4)
+        cancelled.cancel()
+
+        self.assertEqual(first.result(timeout=5), [0, 1, 2, 3])
+        self.assertEqual(len(waiting.result(timeout=5)), 4)
+
+    def test_errors_reach_every_waiting_fetch(self):
+        """Test that a failed API call fails every fetch that was waiting on it."""
+
+        self.server.fail = True
+        futures = [self.fetcher.fetch(4) for _ in range(3)]
+
+        for future in futures:
+            with self.assertRaises(httpx.HTTPStatusError):
+                future.result(timeout=5)
+
+        # Later fetches are unaffected once the API recovers
+        self.server.fail = False
+        self.assertEqual(len(self.fetcher.fetch(4).result(timeout=5)), 4)
@@ -0,0 +1,46 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+import game_cache
+from game_cache import ActiveGameCache
+from game_state import GameState
+from codes import pack_code
+
+
+class ActiveGameCacheTestCase(TestCase):
+    """Test ActiveGameCache class."""
+
+    def setUp(self):
+        """What to do before every test runs."""
+
+        self.cache = ActiveGameCache(ttl_seconds=60)
+
+    def test_add_get_and_evict(self):
+        """Test that games can be cached, found, and evicted."""
+
+        game_state = GameState(1, pack_code([1, 2, 3, 4]))
+        game_state.append(pack_code([0, 0, 0, 0]), 0, 0)
+
+        self.cache.add(1, game_state)
+        self.assertIs(self.cache.get(1), game_state)
+        self.assertIsNone(self.cache.get(2))
+
+        self.cache.evict(1)
+        self.assertIsNone(self.cache.get(1))
+
+    @patch.object(game_cache.time, "monotonic")
+    def test_idle_games_expire(self, mock_monotonic):
+        """Test that games unused for longer than the TTL are dropped."""
+
+        mock_monotonic.return_value = 0
+        self.cache.add(1, GameState(1, 0))
+        self.cache.add(2, GameState(2, 0))
+
+        # Using game 2 keeps it alive past game 1's expiry
+        mock_monotonic.return_value = 40
+        self.cache.get(2)
+
+        mock_monotonic.return_value = 70
+        self.assertIsNone(self.cache.get(1))
+        self.assertIsNotNone(self.cache.get(2))
+        self.assertEqual(len(self.cache), 1)
@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+from unittest import TestCase
+
+from codes import pack_code
+from game_state import GameState, GuessRecord, MAX_GUESSES
+
+
+class GameStateTestCase(TestCase):
+    """Test GameState class."""
+
+    def setUp(self):
+        """What to do before every test runs."""
+
+        self.game_state = GameState(1, pack_code([1, 1, 2, 4]))
+
+    def test_make_guess(self):
+        """Test that a guess is scored and recorded."""
+
+        feedback = self.game_state.make_guess(pack_code([1, 2, 1, 7]))
+
+        self.assertEqual(feedback, (3, 1))
+        self.assertEqual(len(self.game_state), 1)
+        self.assertEqual(self.game_state.feedback_at(0), (3, 1))
+        self.assertEqual(
+            self.game_state.history_record(0),
+            GuessRecord([1, 2, 1, 7], 3, 1),
+        )
+        self.assertFalse(self.game_state.game_over)
+
+    def test_make_winning_guess(self):
+        """Test that a correct guess wins the game."""
+
+        self.game_state.make_guess(pack_code([1, 1, 2, 4]))
+
+        self.assertTrue(self.game_state.has_won)
+        self.assertTrue(self.game_state.game_over)
+
+    def test_out_of_guesses(self):
+        """Test that the game is over once every guess has been used up."""
+
+        for _ in range(MAX_GUESSES):
+            self.assertFalse(self.game_state.game_over)
+            self.game_state.make_guess(pack_code([0, 0, 0, 0]))
+
+        self.assertTrue(self.game_state.game_over)
+        self.assertFalse(self.game_state.has_won)
+
+    def test_copy(self):
+        """Test that a copy can be changed without changing the original."""
+
+        self.game_state.make_guess(pack_code([0, 0, 0, 0]))
+
+        copy = self.game_state.copy()
+        copy.make_guess(pack_code([1, 1, 2, 4]))
+
+        self.assertEqual(len(self.game_state), 1)
+        self.assertFalse(self.game_state.game_over)
+        self.assertEqual(copy.feedback, [(0, 0), (4, 4)])
+        self.assertTrue(copy.has_won)
+
+    def test_snapshot_round_trip(self):
+        """Test that a snapshot restores the same guess history."""
+
+        self.game_state.make_guess(pack_code([0, 0, 0, 0]))
+        self.game_state.make_guess(pack_code([4, 2, 1, 1]))
+
+        restored = GameState(1, self.game_state.packed_answer)
+        restored.load_snapshot(self.game_state.to_snapshot())
+
+        self.assertEqual(restored.packed_guesses, self.game_state.packed_guesses)
+        self.assertEqual(restored.feedback, [(0, 0), (4, 0)])
+
+    def test_game_conversions(self):
+        """
+        Test that a state is built from a game's snapshot and newer guesses,
+        and that the game is updated from it.
+        """
+
+        self.game_state.make_guess(pack_code([0, 0, 0, 0]))
+        game = SimpleNamespace(
+            id=1,
+            answer=[1, 1, 2, 4],
+            num_count=4,
+            lower_bound=0,
+            upper_bound=7,
+            has_won=False,
+            game_over=False,
+            version=2,
+            snapshot=self.game_state.to_snapshot(),
+        )
+        newer_guesses = [GuessRecord([1, 1, 2, 4], 4, 4)]
+
+        game_state = GameState.from_game(game, newer_guesses)
+
+        self.assertEqual(game_state.packed_answer, pack_code([1, 1, 2, 4]))
+        self.assertEqual(game_state.feedback, [(0, 0), (4, 4)])
+
+        game_state.make_guess(pack_code([1, 1, 2, 4]))
+        game_state.apply_to(game)
+
+        self.assertEqual(game.version, 3)
+        self.assertTrue(game.has_won)
+        self.assertTrue(game.game_over)
@@ -0,0 +1,51 @@
+from unittest import TestCase
+
+from lru import LRUCache, MISSING
+
+
+class LRUCacheTestCase(TestCase):
+    """Test LRUCache class."""
+
+    def test_get_and_put(self):
+        """Test that values can be cached and looked up."""
+
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", None)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertIs(cache.get("c"), MISSING)
+
+    def test_evicts_least_recently_used(self):
+        """Test that the least recently used entry is evicted once full."""
+
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+
+        # Using "a" makes "b" the least recently used entry
+        cache.get("a")
+        cache.put("c", 3)
+
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_bounded_by_size(self):
+        """Test that a cache with sizeof is bounded by its values' total size."""
+
+        cache = LRUCache(maxsize=10, sizeof=len)
+        cache.put("a", "xxxx")
+        cache.put("b", "xxxx")
+        cache.put("a", "xx")
+
+        self.assertEqual(cache.size, 6)
+
+        # Making room for "c" takes evicting "b", the least recently used
+        cache.put("c", "xxxxxx")
+
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.size, 8)
+        self.assertEqual(cache.pop("a"), "xx")
+        self.assertEqual(cache.size, 6)
@@ -4,7 +4,13 @@ from dotenv import load_dotenv
 from unittest import TestCase
 from unittest.mock import patch
 
+import numpy as np
+
+from sqlalchemy.orm.exc import StaleDataError
+
 import mastermind
+from game_cache import active_games
+from tasks import background_tasks
 
 load_dotenv()
 
@@ -40,6 +46,11 @@ class MastermindModelTestCase(TestCase):
         mastermind.db.session.commit()
         self.test_game = test_game
 
+    def tearDown(self):
+        """What to do after every test runs."""
+
+        background_tasks.join()
+
     def test_repr(self):
         """Test that the __repr__ method displays the string expected."""
 
@@ -134,6 +145,223 @@ class MastermindModelTestCase(TestCase):
         # Test that True is received for a valid input
         self.assertTrue(self.test_game.validate_num(7))
 
+    def test_history_cached_while_active(self):
+        """Test that an active game's history is served from the cache."""
+
+        self.test_game.handle_guess([1, 1, 1, 1])
+        mastermind.db.session.commit()
+
+        self.assertIsNotNone(active_games.get(self.test_game.id))
+        self.assertEqual(self.test_game.remaining_guesses, 9)
+        self.assertEqual(
+            self.test_game.history[0].numbers_guessed,
+            [1, 1, 1, 1]
+        )
+
+    def test_cache_updated_on_commit(self):
+        """
+        Test that a guess only changes the cached history once it's been
+        committed, and not at all if it's rolled back.
+        """
+
+        self.test_game.handle_guess([0, 0, 0, 0])
+        mastermind.db.session.commit()
+        cached = active_games.get(self.test_game.id)
+
+        self.test_game.handle_guess([1, 1, 1, 1])
+
+        self.assertEqual(self.test_game.guess_count, 2)
+        self.assertEqual(len(cached), 1)
+
+        mastermind.db.session.rollback()
+
+        self.assertIs(active_games.get(self.test_game.id), cached)
+        self.assertEqual(self.test_game.guess_count, 1)
+
+        self.test_game.handle_guess([2, 2, 2, 2])
+        mastermind.db.session.commit()
+
+        self.assertEqual(len(cached), 1)
+        self.assertEqual(len(active_games.get(self.test_game.id)), 2)
+        self.assertEqual(
+            self.test_game.history[1].numbers_guessed,
+            [2, 2, 2, 2]
+        )
+
+    def test_history_falls_back_to_db(self):
+        """Test that a game's history is reloaded from the db on a cache miss."""
+
+        self.test_game.handle_guess([0, 0, 0, 0])
+        mastermind.db.session.commit()
+        active_games.evict(self.test_game.id)
+
+        self.assertEqual(self.test_game.remaining_guesses, 9)
+        self.assertEqual(self.test_game.feedback, ["All incorrect."])
+
+    def test_history_rebuilt_from_snapshot(self):
+        """
+        Test that on a cache miss, a game's history is rebuilt from its latest
+        snapshot plus the guesses made since.
+        """
+
+        for _ in range(mastermind.SNAPSHOT_EVERY_GUESSES + 1):
+            self.test_game.handle_guess([0, 0, 0, 0])
+        mastermind.db.session.commit()
+
+        self.assertEqual(
+            self.test_game.snapshot_version,
+            mastermind.SNAPSHOT_EVERY_GUESSES,
+        )
+        self.assertEqual(
+            [guess.seq for guess in mastermind.Guess.query.order_by(mastermind.Guess.id)],
+            list(range(1, mastermind.SNAPSHOT_EVERY_GUESSES + 2)),
+        )
+
+        # Doctor the snapshot, so we can tell it's what the history came from
+        with mastermind.db.engine.begin() as connection:
+            connection.execute(
+                mastermind.MastermindGame.__table__.update()
+                .where(mastermind.MastermindGame.id == self.test_game.id)
+                .values(snapshot={
+                    "guesses": [[0, 4, 0]] * mastermind.SNAPSHOT_EVERY_GUESSES,
+                })
+            )
+        mastermind.db.session.expire(self.test_game)
+        active_games.evict(self.test_game.id)
+
+        history = self.test_game.history
+
+        self.assertEqual(len(history), mastermind.SNAPSHOT_EVERY_GUESSES + 1)
+        self.assertEqual(history[0].correct_num_count, 4)
+        self.assertEqual(history[-1].correct_num_count, 0)
+
+    def test_guess_pages(self):
+        """Test that the guess history can be paged through, latest first."""
+
+        guesses = [[0, 0, 0, 0], [1, 1, 1, 1], [2, 2, 2, 2], [3, 3, 3, 3], [5, 5, 5, 5]]
+        for numbers_guessed in guesses:
+            self.test_game.handle_guess(numbers_guessed)
+        mastermind.db.session.commit()
+
+        latest = self.test_game.get_guess_page(page_size=2)
+        middle = self.test_game.get_guess_page(latest.older_cursor, page_size=2)
+        first = self.test_game.get_guess_page(middle.older_cursor, page_size=2)
+
+        self.assertEqual(
+            [guess.numbers_guessed for guess in latest.guesses],
+            guesses[3:],
+        )
+        self.assertEqual(latest.first_number, 4)
+        self.assertEqual(
+            [guess.numbers_guessed for guess in middle.guesses],
+            guesses[1:3],
+        )
+        self.assertEqual(middle.first_number, 2)
+        self.assertEqual(
+            [guess.numbers_guessed for guess in first.guesses],
+            guesses[:1],
+        )
+        self.assertEqual(first.first_number, 1)
+        self.assertIsNone(first.older_cursor)
+
+        self.assertRaises(ValueError, self.test_game.get_guess_page, "nonsense")
+
+    def test_finished_game_evicted(self):
+        """Test that a game is dropped from the cache once it's over."""
+
+        self.test_game.handle_guess([1, 1, 2, 4])
+        mastermind.db.session.commit()
+
+        self.assertIsNone(active_games.get(self.test_game.id))
+        self.assertEqual(self.test_game.history[0].correct_location_count, 4)
+
+    def test_guess_analytics_recorded(self):
+        """Test that guesses are annotated with analytics as they're made."""
+
+        self.test_game.handle_guess([0, 0, 0, 0])
+        mastermind.db.session.commit()
+        self.test_game.handle_guess([1, 1, 1, 1])
+        mastermind.db.session.commit()
+
+        # Analytics are recorded in the background once the guess is committed
+        background_tasks.join()
+        mastermind.db.session.expire_all()
+
+        first, second = self.test_game.guess_history
+
+        self.assertEqual(first.candidates_before, 8 ** 4)
+        self.assertEqual(first.candidates_after, 7 ** 4)
+        self.assertEqual(second.candidates_before, 7 ** 4)
+        self.assertLess(second.candidates_after, second.candidates_before)
+        self.assertGreater(second.feedback_entropy, 0)
+
+    @patch.object(mastermind.requests, "get")
+    def test_guess_candidates_carried_over(self, mock_fetch):
+        """
+        Test that the candidates left after a guess's analytics are kept for
+        the next guess's, on boards with and without a partition table.
+        """
+
+        mock_fetch.return_value.text = "1\n1\n2\n4\n5\n"
+        big_game = mastermind.MastermindGame.generate_new_game(num_count=5)
+        mastermind.db.session.commit()
+
+        for game in (self.test_game, big_game):
+            game.handle_guess([0] * game.num_count)
+            mastermind.db.session.commit()
+            background_tasks.join()
+            game.handle_guess([1] * game.num_count)
+            mastermind.db.session.commit()
+            background_tasks.join()
+
+            mastermind.db.session.expire_all()
+            second = game.guess_history[1]
+            candidates = mastermind.guess_candidates.get((game.id, 2))
+
+            self.assertNotIn((game.id, 1), mastermind.guess_candidates)
+            self.assertEqual(len(candidates), second.candidates_after)
+            self.assertEqual(candidates.dtype, np.uint16)
+
+        # Nothing is kept once the game is over
+        self.test_game.handle_guess([1, 1, 2, 4])
+        mastermind.db.session.commit()
+        background_tasks.join()
+
+        self.assertTrue(self.test_game.game_over)
+        self.assertNotIn((self.test_game.id, 2), mastermind.guess_candidates)
+        self.assertNotIn((self.test_game.id, 3), mastermind.guess_candidates)
+
+    def test_concurrent_guess_rejected(self):
+        """
+        Test that a guess made from an out of date version of the game is
+        rejected when committed.
+        """
+
+        # Load the game as it was before the other request's guess
+        self.assertEqual(self.test_game.version, 0)
+
+        # Simulate another request making a guess and committing it first
+        with mastermind.db.engine.begin() as connection:
+            connection.execute(
+                mastermind.MastermindGame.__table__.update()
+                .where(mastermind.MastermindGame.id == self.test_game.id)
+                .values(version=1)
+            )
+
+        # Guesses are flushed straight away on boards with analytics, so the
+        # conflict can come up before the commit
+        with self.assertRaises(StaleDataError):
+            self.test_game.handle_guess([0, 0, 0, 0])
+            mastermind.db.session.commit()
+        mastermind.db.session.rollback()
+
+        self.assertEqual(mastermind.Guess.query.count(), 0)
+        # The rejected guess isn't left in the history
+        self.assertNotIn(
+            [0, 0, 0, 0],
+            [guess.numbers_guessed for guess in self.test_game.history],
+        )
+
 
 class GuessModelTestCase(TestCase):
     """Test Guess class."""
@@ -156,6 +384,7 @@ class GuessModelTestCase(TestCase):
 
         test_guess = mastermind.Guess(
             game_id=test_game.id,
+            seq=1,
             numbers_guessed=[0, 0, 0, 0],
             correct_num_count=0,
             correct_location_count=0
@@ -184,6 +413,7 @@ class GuessModelTestCase(TestCase):
 
         mastermind.Guess.generate_new_guess(
             game_id=self.test_game.id,
+            seq=2,
             numbers_guessed=[1, 2, 3, 4],
             correct_num_count=2,
             correct_location_count=2
@@ -0,0 +1,93 @@
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from codes import all_codes, score_codes
+from partitions import PartitionTable, get_partition_table, has_partition_table
+
+
+class PartitionTableTestCase(TestCase):
+    """Test PartitionTable class."""
+
+    # A small board keeps building the table quick
+    NUM_COUNT = 3
+    LOWER_BOUND = 1
+    UPPER_BOUND = 4
+
+    def setUp(self):
+        self.codes = all_codes(self.NUM_COUNT, self.LOWER_BOUND, self.UPPER_BOUND)
+        self.table = PartitionTable.build(
+            self.NUM_COUNT,
+            self.LOWER_BOUND,
+            self.UPPER_BOUND,
+        )
+
+    def feedback_keys(self, candidates, guess):
+        nums, locations = score_codes(
+            candidates,
+            guess,
+            self.NUM_COUNT,
+            self.LOWER_BOUND,
+            self.UPPER_BOUND,
+        )
+        return nums * (self.NUM_COUNT + 1) + locations
+
+    def test_compatible_codes_match_scoring(self):
+        """
+        Test that the codes compatible with every (guess, feedback) pair are
+        exactly the ones that scoring finds, in sorted order.
+        """
+
+        for guess in self.codes.tolist():
+            feedback_keys = self.feedback_keys(self.codes, guess)
+
+            for nums in range(self.NUM_COUNT + 1):
+                for locations in range(nums + 1):
+                    key = nums * (self.NUM_COUNT + 1) + locations
+                    self.assertEqual(
+                        self.table.compatible_codes(guess, nums, locations).tolist(),
+                        self.codes[feedback_keys == key].tolist(),
+                    )
+
+    def test_partition_matches_scoring(self):
+        """Test that splitting up candidates agrees with scoring them."""
+
+        candidates = self.codes[::3]
+        feedback_keys = self.feedback_keys(candidates, 10)
+
+        partition_sizes, remaining = self.table.partition(candidates, 10, 2, 1)
+
+        self.assertEqual(
+            partition_sizes.tolist(),
+            np.bincount(feedback_keys, minlength=len(partition_sizes)).tolist(),
+        )
+        self.assertEqual(
+            remaining.tolist(),
+            candidates[feedback_keys == 2 * (self.NUM_COUNT + 1) + 1].tolist(),
+        )
+
+    def test_save_and_load(self):
+        """Test that a saved table is memory-mapped back unchanged."""
+
+        with tempfile.TemporaryDirectory() as directory:
+            self.table.save(directory)
+            loaded = PartitionTable.load(
+                self.NUM_COUNT,
+                self.LOWER_BOUND,
+                self.UPPER_BOUND,
+                directory,
+            )
+
+            self.assertIsInstance(loaded.codes_by_feedback, np.memmap)
+            self.assertTrue(
+                (loaded.codes_by_feedback == self.table.codes_by_feedback).all()
+            )
+            self.assertTrue((loaded.offsets == self.table.offsets).all())
+
+    def test_big_boards_skipped(self):
+        """Test that boards too big for a table don't get one."""
+
+        self.assertTrue(has_partition_table(4, 0, 7))
+        self.assertFalse(has_partition_table(6, 0, 7))
+        self.assertIsNone(get_partition_table(6, 0, 7))
@@ -0,0 +1,242 @@
+import os
+from dotenv import load_dotenv
+
+from unittest import TestCase
+from unittest.mock import patch
+
+import mastermind
+import rooms
+from codes import pack_code
+from metrics import metrics
+from rooms import (
+    RaceRoom, RaceGuess, RaceRoomRecord, RaceRoomRegistry, race_rooms,
+)
+
+load_dotenv()
+
+# This line must run before we import the app
+os.environ['DATABASE_URL'] = os.environ["TEST_DATABASE_URL"]
+
+from app import app, RACE_PLAYER_KEY
+
+
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+mastermind.db.create_all()
+
+
+class RaceRoomTestCase(TestCase):
+    """Test RaceRoom class."""
+
+    def test_play_round(self):
+        """Test that every queued guess is scored when a round is played."""
+
+        room = RaceRoom(1, [1, 1, 2, 4])
+        room.join("a", "Ada")
+        room.join("b", "Bea")
+
+        self.assertFalse(room.submit_guess("a", [1, 7, 6, 4]))
+        self.assertTrue(room.submit_guess("b", [1, 1, 2, 4]))
+
+        rows = room.play_round()
+
+        self.assertEqual(
+            [(row["player_id"], row["correct_num_count"], row["correct_location_count"])
+             for row in rows],
+            [("a", 2, 2), ("b", 4, 4)]
+        )
+        self.assertEqual(room.round, 1)
+        self.assertEqual(room.racing_players(), ["a"])
+        self.assertEqual(
+            [standing["name"] for standing in room.standings()],
+            ["Bea", "Ada"]
+        )
+
+    def test_guesses_queued_while_saving_kept(self):
+        """
+        Test that guesses queued while a round is being saved are left for the
+        next round, rather than dropped along with the scored ones.
+        """
+
+        room = RaceRoom(1, [1, 1, 2, 4])
+        room.join("a", "Ada")
+        room.join("b", "Bea")
+        room.join("c", "Cy")
+        room.submit_guess("a", [0, 0, 0, 0])
+        room.submit_guess("c", [3, 3, 3, 3])
+
+        rows = room.score_round()
+        room.submit_guess("b", [5, 5, 5, 5])
+        room.submit_guess("c", [6, 6, 6, 6])
+        room.finish_round(rows)
+
+        self.assertEqual(room.round, 1)
+        self.assertEqual(
+            room.pending,
+            {"b": pack_code([5, 5, 5, 5]), "c": pack_code([6, 6, 6, 6])}
+        )
+        self.assertEqual(len(room.players["c"].guesses), 1)
+
+    def test_finished_player_cannot_guess(self):
+        """Test that players who've won can't keep guessing."""
+
+        room = RaceRoom(1, [1, 1, 2, 4])
+        room.join("a", "Ada")
+        room.submit_guess("a", [1, 1, 2, 4])
+        room.play_round()
+
+        self.assertRaises(ValueError, room.submit_guess, "a", [0, 0, 0, 0])
+        self.assertRaises(ValueError, room.submit_guess, "z", [0, 0, 0, 0])
+
+
+class RaceRoomRegistryTestCase(TestCase):
+    """Test saving and restoring race rooms."""
+
+    def setUp(self):
+        """What to do before every test runs."""
+
+        RaceRoomRecord.query.delete()
+        mastermind.db.session.commit()
+        race_rooms.clear()
+
+    def tearDown(self):
+        """What to do after every test runs."""
+
+        mastermind.db.session.rollback()
+        race_rooms.clear()
+
+    @patch.object(rooms, "SNAPSHOT_EVERY_ROUNDS", 2)
+    def test_rebuild_from_snapshot_and_guesses(self):
+        """
+        Test that a room that's no longer in memory is rebuilt from its
+        snapshot plus the guesses saved since.
+        """
+
+        room = race_rooms.create([1, 2, 3, 4])
+        race_rooms.join(room, "a", "Ada")
+        race_rooms.join(room, "b", "Bea")
+
+        for guess in ([0, 0, 0, 0], [1, 1, 1, 1], [1, 2, 3, 4]):
+            room.submit_guess("a", guess)
+            room.submit_guess("b", [5, 5, 5, 5])
+            race_rooms.play_round(room)
+
+        self.assertEqual(RaceGuess.query.count(), 6)
+        self.assertEqual(
+            mastermind.db.session.get(RaceRoomRecord, room.id).snapshot_round,
+            2
+        )
+
+        race_rooms.clear()
+        rebuilt_room = race_rooms.get(room.id)
+
+        self.assertIsNot(rebuilt_room, room)
+        self.assertEqual(rebuilt_room.round, 3)
+        self.assertEqual(rebuilt_room.standings(), room.standings())
+        self.assertEqual(rebuilt_room.feedback_for("a"), room.feedback_for("a"))
+
+
+    def test_round_saved_once(self):
+        """
+        Test that when two worker processes play the same round, only the
+        first is saved, and the other reloads the room from the database.
+        """
+
+        room = race_rooms.create([1, 2, 3, 4])
+        race_rooms.join(room, "a", "Ada")
+
+        # Another worker process, with its own copy of the room
+        other_rooms = RaceRoomRegistry()
+        other_room = other_rooms.get(room.id)
+
+        room.submit_guess("a", [0, 0, 0, 0])
+        other_room.submit_guess("a", [1, 1, 1, 1])
+
+        metrics.reset()
+        self.assertEqual(other_rooms.play_round(other_room), 1)
+        self.assertEqual(race_rooms.play_round(room), 0)
+
+        self.assertEqual(metrics.get("race_round_conflicts"), 1)
+        self.assertEqual(RaceGuess.query.count(), 1)
+        self.assertEqual(room.round, 0)
+
+        reloaded_room = race_rooms.get(room.id)
+
+        self.assertEqual(reloaded_room.round, 1)
+        self.assertEqual(
+            reloaded_room.feedback_for("a"),
+            [([1, 1, 1, 1], 1, 1)]
+        )
+
+    def test_failed_commit_keeps_round(self):
+        """
+        Test that a room doesn't move on to the next round if saving the
+        round fails.
+        """
+
+        room = race_rooms.create([1, 2, 3, 4])
+        race_rooms.join(room, "a", "Ada")
+        room.submit_guess("a", [0, 0, 0, 0])
+
+        with patch.object(rooms.db.session, "commit", side_effect=RuntimeError):
+            self.assertRaises(RuntimeError, race_rooms.play_round, room)
+
+        self.assertEqual(room.round, 0)
+        self.assertEqual(room.feedback_for("a"), [])
+
+    def test_idle_rooms_expire(self):
+        """Test that rooms unused for longer than the TTL are dropped."""
+
+        expiring_rooms = RaceRoomRegistry(ttl_seconds=0)
+        room = expiring_rooms.create([1, 2, 3, 4])
+
+        self.assertIsNot(expiring_rooms.get(room.id), room)
+
+
+class RaceRoomRoutesTestCase(TestCase):
+    """Test the race room routes."""
+
+    def setUp(self):
+        """What to do before every test runs."""
+
+        RaceRoomRecord.query.delete()
+        mastermind.db.session.commit()
+        race_rooms.clear()
+
+    def tearDown(self):
+        """What to do after every test runs."""
+
+        mastermind.db.session.rollback()
+        race_rooms.clear()
+
+    @patch.object(mastermind.requests, "get")
+    def test_race(self, mock_fetch):
+        """Test that a player can start a room, join it and win the race."""
+
+        mock_fetch.return_value.text = "1\n2\n3\n4\n"
+
+        with app.test_client() as client:
+            response = client.post('/rooms', data={"num-count": "4"})
+            room_url = response.location
+
+            client.post(f"{room_url}/join", data={"name": "Ada"})
+
+            with client.session_transaction() as change_session:
+                self.assertIn(RACE_PLAYER_KEY, change_session)
+
+            response = client.post(
+                f"{room_url}/guess",
+                data={
+                    "num-0": "1",
+                    "num-1": "2",
+                    "num-2": "3",
+                    "num-3": "4",
+                },
+                follow_redirects=True
+            )
+            html = response.get_data(as_text=True)
+
+            self.assertEqual(response.status_code, 200)
+            self.assertIn("You cracked it in 1 guesses!", html)
+            self.assertIn("Ada: 1 guess(es)", html)
@@ -0,0 +1,57 @@
+from unittest import TestCase
+from unittest.mock import patch
+
+from codes import pack_code
+from mastermind import MastermindGame
+from seeded import SeededRandomNums
+
+
+class SeededRandomNumsTestCase(TestCase):
+    """Test SeededRandomNums class."""
+
+    def test_same_seed_same_answers(self):
+        """Test that answers depend only on the seed and the sequence."""
+
+        first = SeededRandomNums(42)
+        second = SeededRandomNums(42)
+
+        answers = [first(4) for _ in range(10)]
+
+        self.assertEqual([second(4) for _ in range(10)], answers)
+        self.assertNotEqual([SeededRandomNums(43)(4) for _ in range(10)], answers)
+
+        first.reset()
+        self.assertEqual(first(4), answers[0])
+
+    def test_answers_within_bounds(self):
+        """Test that answers have num_count numbers within the bounds."""
+
+        seeded = SeededRandomNums(0)
+
+        for _ in range(100):
+            answer = seeded(6, 1, 5)
+            self.assertEqual(len(answer), 6)
+            self.assertTrue(all(1 <= n <= 5 for n in answer))
+
+    def test_answers_match_generated_block(self):
+        """
+        Test that answers handed out one at a time match a block generated
+        up front, including across a block boundary.
+        """
+
+        seeded = SeededRandomNums(7, block_size=8)
+        answers = [pack_code(seeded(4)) for _ in range(16)]
+
+        self.assertEqual(
+            answers,
+            seeded.generate_block(0, 4).tolist() + seeded.generate_block(1, 4).tolist(),
+        )
+
+    def test_used_by_fetch_random_nums(self):
+        """Test that a configured source replaces the random numbers API."""
+
+        seeded = SeededRandomNums(42)
+        expected = SeededRandomNums(42).answer_for(0, 4)
+
+        with patch.object(MastermindGame, "random_nums_source", seeded):
+            self.assertEqual(MastermindGame._fetch_random_nums(4), expected)
@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+from codes import pack_code
+from solver import STRATEGIES, play_game, simulate
+
+
+class SolverTestCase(TestCase):
+    """Test the solving strategies and simulator."""
+
+    def test_strategies_solve_every_secret(self):
+        """Test that every strategy solves every secret on a small board."""
+
+        for strategy_name in STRATEGIES:
+            results = simulate(
+                strategy_name,
+                num_count=3,
+                lower_bound=0,
+                upper_bound=3,
+            )
+
+            self.assertEqual(results["games"], 4 ** 3)
+            self.assertEqual(sum(results["distribution"].values()), 4 ** 3)
+            self.assertLessEqual(results["max_guesses"], 10)
+
+    def test_knuth_solves_classic_board(self):
+        """Test that the knuth strategy solves a 4 number game quickly."""
+
+        guesses = play_game("knuth", pack_code([7, 1, 3, 3]))
+        self.assertLessEqual(guesses, 7)
+
+    def test_simulate_sample_with_workers(self):
+        """Test that a sample of secrets can be played across processes."""
+
+        results = simulate("random", games=20, workers=2, seed=1)
+
+        self.assertEqual(results["games"], 20)
+        self.assertGreater(results["codes_per_second"], 0)
+        self.assertRaises(ValueError, simulate, "psychic")
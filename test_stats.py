@@ -0,0 +1,76 @@
+import os
+from dotenv import load_dotenv
+
+from unittest import TestCase
+
+import mastermind
+from stats import GameResultCount
+
+load_dotenv()
+
+# This line must run before we import the app
+os.environ['DATABASE_URL'] = os.environ["TEST_DATABASE_URL"]
+
+from app import app
+
+
+app.config['TESTING'] = True
+app.config['WTF_CSRF_ENABLED'] = False
+
+mastermind.db.create_all()
+
+
+class GameResultCountTestCase(TestCase):
+    """Test GameResultCount class."""
+
+    def setUp(self):
+        """What to do before every test runs."""
+
+        GameResultCount.query.delete()
+        mastermind.db.session.commit()
+
+    def tearDown(self):
+        """What to do after every test runs."""
+
+        mastermind.db.session.rollback()
+
+    def test_record_result(self):
+        """Test that recording the same result twice increments its count."""
+
+        GameResultCount.record_result(4, True, 5)
+        GameResultCount.record_result(4, True, 5)
+        mastermind.db.session.commit()
+
+        row = GameResultCount.query.one()
+        self.assertEqual(row.games, 2)
+
+    def test_summarize(self):
+        """Test that results are summarized for each num_count."""
+
+        GameResultCount.record_result(4, True, 3)
+        GameResultCount.record_result(4, True, 6)
+        GameResultCount.record_result(4, False, 10)
+        GameResultCount.record_result(6, False, 10)
+        mastermind.db.session.commit()
+
+        self.assertEqual(
+            GameResultCount.summarize(),
+            [
+                {
+                    "num_count": 4,
+                    "games_played": 3,
+                    "games_won": 2,
+                    "win_rate": 2 / 3,
+                    "average_guesses_to_win": 4.5,
+                    "wins_by_guess_count": {3: 1, 6: 1},
+                },
+                {
+                    "num_count": 6,
+                    "games_played": 1,
+                    "games_won": 0,
+                    "win_rate": 0,
+                    "average_guesses_to_win": None,
+                    "wins_by_guess_count": {},
+                },
+            ]
+        )
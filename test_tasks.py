@@ -0,0 +1,178 @@
+import os
+from dotenv import load_dotenv
+from threading import Event
+from unittest import TestCase
+
+from db import db
+from metrics import metrics
+from tasks import (
+    TaskQueue, background_tasks, run_after_commit, submit_after_commit,
+)
+
+load_dotenv()
+
+# This line must run before we import the app
+os.environ['DATABASE_URL'] = os.environ["TEST_DATABASE_URL"]
+
+from app import app
+
+
+app.config['TESTING'] = True
+
+
+class FlakyTask:
+    """A stand-in for side work that fails a given number of times first."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, results, value):
+        self.calls += 1
+
+        if self.calls <= self.failures:
+            raise ConnectionError()
+
+        results.append(value)
+
+
+class TaskQueueTestCase(TestCase):
+    """Test TaskQueue class."""
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_runs_tasks(self):
+        """Test that submitted tasks are run in the background."""
+
+        tasks = TaskQueue(workers=2)
+        results = []
+
+        for value in range(10):
+            self.assertTrue(tasks.submit(results.append, value))
+        tasks.join()
+
+        self.assertEqual(sorted(results), list(range(10)))
+
+    def test_retries_failed_tasks(self):
+        """Test that a failing task is retried until it succeeds."""
+
+        tasks = TaskQueue(workers=1, max_attempts=3, retry_delay_seconds=0)
+        task = FlakyTask(failures=2)
+        results = []
+
+        tasks.submit(task, results, "done")
+        tasks.join()
+
+        self.assertEqual(results, ["done"])
+        self.assertEqual(task.calls, 3)
+        self.assertEqual(metrics.get("background_tasks_retried"), 2)
+
+    def test_gives_up_on_failing_tasks(self):
+        """Test that a task that keeps failing is given up on."""
+
+        tasks = TaskQueue(workers=1, max_attempts=2, retry_delay_seconds=0)
+        task = FlakyTask(failures=5)
+
+        tasks.submit(task, [], "never")
+        tasks.join()
+
+        self.assertEqual(task.calls, 2)
+        self.assertEqual(metrics.get("background_tasks_failed"), 1)
+
+    def test_runs_inline_when_full(self):
+        """
+        Test that once the queue is full, submitting a task runs it in the
+        caller instead.
+        """
+
+        tasks = TaskQueue(workers=1, max_pending=1)
+        started = Event()
+        release = Event()
+        results = []
+
+        def block():
+            started.set()
+            release.wait()
+
+        # Tie up the only worker, then fill the queue
+        tasks.submit(block)
+        started.wait(timeout=5)
+        tasks.submit(results.append, "queued")
+
+        self.assertFalse(tasks.submit(results.append, "inline"))
+        self.assertEqual(results, ["inline"])
+        self.assertEqual(metrics.get("background_tasks_run_inline"), 1)
+
+        release.set()
+        tasks.join()
+        self.assertEqual(results, ["inline", "queued"])
+
+
+class SubmitAfterCommitTestCase(TestCase):
+    """Test submit_after_commit function."""
+
+    def setUp(self):
+        """What to do before every test runs."""
+
+        # Tasks are queued in a transaction that's already begun, by a flush
+        db.session.connection()
+
+    def tearDown(self):
+        db.session.rollback()
+
+    def test_runs_after_commit(self):
+        """Test that a task only runs once the transaction commits."""
+
+        results = []
+
+        submit_after_commit(results.append, "committed")
+        background_tasks.join()
+        self.assertEqual(results, [])
+
+        db.session.commit()
+        background_tasks.join()
+        self.assertEqual(results, ["committed"])
+
+    def test_dropped_on_rollback(self):
+        """Test that a task is dropped if the transaction rolls back."""
+
+        results = []
+
+        submit_after_commit(results.append, "rolled back")
+        db.session.rollback()
+        db.session.commit()
+        background_tasks.join()
+
+        self.assertEqual(results, [])
+
+    def test_kept_when_savepoint_rolls_back(self):
+        """
+        Test that rolling back a savepoint doesn't drop tasks queued by the
+        transaction around it.
+        """
+
+        results = []
+
+        submit_after_commit(results.append, "outer")
+        db.session.begin_nested().rollback()
+        db.session.commit()
+        background_tasks.join()
+
+        self.assertEqual(results, ["outer"])
+
+    def test_callback_runs_on_commit(self):
+        """
+        Test that a callback is run as soon as the transaction commits, and
+        dropped if it rolls back.
+        """
+
+        results = []
+
+        run_after_commit(results.append, "rolled back")
+        db.session.rollback()
+        db.session.connection()
+        run_after_commit(results.append, "committed")
+        db.session.commit()
+
+        self.assertEqual(results, ["committed"])